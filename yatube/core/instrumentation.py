@@ -0,0 +1,195 @@
+"""Замеры запросов: SQL, шаблоны, кеш и общее время по представлениям.
+
+InstrumentationMiddleware отдаёт замеры заголовком Server-Timing и
+копит гистограммы в core.metrics, откуда их забирает /metrics. Время
+шаблонов включает SQL, выполненный при рендере ленивыми queryset.
+"""
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.template.backends.django import Template
+from django.urls import Resolver404, resolve
+from django.utils.module_loading import import_string
+
+from core import metrics
+
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+_local = threading.local()
+_missing = object()
+
+
+class RequestTimings:
+    """Замеры одного запроса; заодно execute_wrapper для SQL."""
+
+    def __init__(self):
+        self.sql_time = 0
+        self.sql_count = 0
+        self.template_time = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.total = 0
+        self.view = None
+        # Шаблоны, которые рендерятся сейчас, от внешнего к вложенному.
+        self.templates = []
+        # get_many кеша может вызывать get: такие чтения не считаются.
+        self.in_cache = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.sql_count += 1
+
+    def server_timing(self):
+        return ', '.join((
+            f'sql;dur={self.sql_time * 1000:.1f};'
+            f'desc="{self.sql_count} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'cache;desc="{self.cache_hits} hits, '
+            f'{self.cache_misses} misses"',
+            f'total;dur={self.total * 1000:.1f}',
+        ))
+
+    def record(self, view, method, status):
+        metrics.inc(
+            'http_requests_total', view=view, method=method, status=status
+        )
+        metrics.observe('http_request_duration_seconds', self.total,
+                        view=view)
+        metrics.observe('db_query_duration_seconds', self.sql_time,
+                        view=view)
+        metrics.observe('db_queries_per_request', self.sql_count,
+                        buckets=QUERY_BUCKETS, view=view)
+        metrics.observe('template_render_duration_seconds',
+                        self.template_time, view=view)
+        for result, count in (
+            ('hit', self.cache_hits), ('miss', self.cache_misses),
+        ):
+            if count:
+                metrics.inc(
+                    'cache_requests_total', count, view=view, result=result
+                )
+
+
+def current():
+    """Замеры текущего запроса или None вне InstrumentationMiddleware."""
+    return getattr(_local, 'timings', None)
+
+
+def _timed_render(render):
+    @wraps(render)
+    def wrapper(self, *args, **kwargs):
+        timings = current()
+        if timings is None:
+            return render(self, *args, **kwargs)
+        # Вложенный рендер уже входит во время внешнего.
+        outermost = not timings.templates
+        timings.templates.append(self.origin.template_name)
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            timings.templates.pop()
+            if outermost:
+                timings.template_time += time.perf_counter() - started
+    wrapper.instrumented = True
+    return wrapper
+
+
+def _counted_get(get):
+    @wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        timings = current()
+        if timings is None or timings.in_cache:
+            return get(self, key, default, version)
+        timings.in_cache = True
+        try:
+            value = get(self, key, _missing, version)
+        finally:
+            timings.in_cache = False
+        if value is _missing:
+            timings.cache_misses += 1
+            return default
+        timings.cache_hits += 1
+        return value
+    wrapper.instrumented = True
+    return wrapper
+
+
+def _counted_get_many(get_many):
+    @wraps(get_many)
+    def wrapper(self, keys, version=None):
+        timings = current()
+        if timings is None or timings.in_cache:
+            return get_many(self, keys, version=version)
+        keys = list(keys)
+        timings.in_cache = True
+        try:
+            found = get_many(self, keys, version=version)
+        finally:
+            timings.in_cache = False
+        timings.cache_hits += len(found)
+        timings.cache_misses += len(keys) - len(found)
+        return found
+    wrapper.instrumented = True
+    return wrapper
+
+
+def instrument():
+    """Оборачивает рендер шаблонов и чтение кешей из CACHES.
+
+    Обёртки ставятся на классы один раз и вне запроса ничего не
+    делают.
+    """
+    if not getattr(Template.render, 'instrumented', False):
+        Template.render = _timed_render(Template.render)
+    for options in settings.CACHES.values():
+        backend = import_string(options['BACKEND'])
+        if not getattr(backend.get, 'instrumented', False):
+            backend.get = _counted_get(backend.get)
+        if not getattr(backend.get_many, 'instrumented', False):
+            backend.get_many = _counted_get_many(backend.get_many)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        # Ответ из кеша страниц отдан до разбора адреса.
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'unresolved'
+    return match.view_name
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = current()
+        if timings is not None:
+            timings.view = request.resolver_match.view_name
+
+    def __call__(self, request):
+        timings = _local.timings = RequestTimings()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timings):
+                response = self.get_response(request)
+        finally:
+            _local.timings = None
+        timings.total = time.perf_counter() - started
+        timings.record(
+            view_name(request), request.method, response.status_code
+        )
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = timings.server_timing()
+        return response
@@ -0,0 +1,195 @@
+"""Очередь фоновых задач в базе данных, без внешнего брокера.
+
+Задача -- функция уровня модуля, помеченная @task. enqueue() пишет её
+вызов в таблицу Job в текущей транзакции: задача видна воркеру, только
+если изменения, ради которых она поставлена, зафиксированы. Задачи
+выполняет manage.py runworker в пуле процессов, продлевая аренду, пока
+задача идёт; упавшие повторяются с растущей паузой, после
+JOBS_MAX_ATTEMPTS попыток остаются FAILED.
+"""
+import json
+import logging
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core import metrics, query_budget
+from core.models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def task(func):
+    """Разрешает ставить функцию в очередь: enqueue(func, *args)."""
+    func.job_name = f'{func.__module__}.{func.__qualname__}'
+    return func
+
+
+def enqueue(func, *args, delay=0):
+    """Ставит вызов func(*args) в очередь; аргументы -- JSON.
+
+    С JOBS_EAGER задача выполняется сразу, в текущем процессе.
+    """
+    if settings.JOBS_EAGER:
+        with query_budget.exempt():
+            func(*args)
+        return None
+    return Job.objects.create(
+        name=func.job_name,
+        args=json.dumps(args),
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def _ready(now):
+    # Задачи RUNNING с истёкшей арендой остались от упавшего воркера.
+    return (Q(status=Job.QUEUED, run_at__lte=now)
+            | Q(status=Job.RUNNING, locked_until__lt=now))
+
+
+def abandon(now):
+    """Брошенные задачи, исчерпавшие попытки, помечает FAILED.
+
+    Задача, которая роняет процесс воркера, не доходит до finish() и
+    без этого забиралась бы снова бесконечно.
+    """
+    expired = Job.objects.filter(
+        status=Job.RUNNING,
+        locked_until__lt=now,
+        attempts__gte=settings.JOBS_MAX_ATTEMPTS,
+    )
+    for pk, name in expired.values_list('pk', 'name'):
+        if expired.filter(pk=pk).update(
+            status=Job.FAILED,
+            locked_until=None,
+            last_error='Аренда истекла: процесс воркера не вернулся',
+        ):
+            metrics.inc('jobs_total', job=name, status='failed')
+
+
+def claim(limit):
+    """Забирает до limit готовых задач: список (id, срок аренды)."""
+    now = timezone.now()
+    abandon(now)
+    lease = now + timedelta(seconds=settings.JOBS_LEASE)
+    candidates = Job.objects.filter(_ready(now)).order_by(
+        'run_at', 'pk').values_list('pk', flat=True)[:limit]
+    claimed = []
+    for pk in candidates:
+        # Условный UPDATE: задачу, которую уже забрал другой воркер,
+        # повторно не взять.
+        if Job.objects.filter(_ready(now), pk=pk).update(
+            status=Job.RUNNING,
+            attempts=F('attempts') + 1,
+            locked_until=lease,
+        ):
+            claimed.append((pk, lease))
+    return claimed
+
+
+class Heartbeat(threading.Thread):
+    """Продлевает аренду задачи, пока она выполняется.
+
+    Без продления задачу дольше JOBS_LEASE забрал бы второй воркер.
+    Аренда продлевается, только пока она наша: если задачу уже забрали,
+    поток останавливается.
+    """
+
+    def __init__(self, job_id, lease):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self.lease = lease
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.JOBS_LEASE / 3):
+                try:
+                    if not self.renew():
+                        return
+                except DatabaseError:
+                    logger.warning('Не удалось продлить аренду задачи %s',
+                                   self.job_id, exc_info=True)
+        finally:
+            connection.close()
+
+    def renew(self):
+        """Продлевает аренду; False, если задача уже не наша."""
+        lease = timezone.now() + timedelta(seconds=settings.JOBS_LEASE)
+        if not Job.objects.filter(
+            pk=self.job_id, locked_until=self.lease
+        ).update(locked_until=lease):
+            return False
+        self.lease = lease
+        return True
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.lease
+
+
+def execute(job_id, lease):
+    """Выполняет задачу, возвращает (job_id, аренда, ошибка, секунды).
+
+    Вызывается в процессе пула, поэтому в Job пишет только продление
+    аренды.
+    """
+    job = Job.objects.filter(pk=job_id).first()
+    if job is None:
+        return job_id, lease, '', 0
+    heartbeat = Heartbeat(job_id, lease)
+    heartbeat.start()
+    started = time.monotonic()
+    error = ''
+    try:
+        func = import_string(job.name)
+        if getattr(func, 'job_name', None) != job.name:
+            raise ValueError(f'{job.name} не помечена как задача')
+        func(*json.loads(job.args))
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        lease = heartbeat.stop()
+    return job_id, lease, error, time.monotonic() - started
+
+
+def finish(job_id, lease, error, duration):
+    """Записывает результат: удаляет задачу, откладывает или бросает.
+
+    Если аренда истекла и задачу забрал другой воркер, результат
+    отбрасывается и возвращается False.
+    """
+    job = Job.objects.filter(pk=job_id, locked_until=lease).first()
+    if job is None:
+        logger.warning('Задача %s уже не наша: аренда истекла', job_id)
+        return False
+    metrics.observe('job_duration_seconds', duration, job=job.name)
+    if not error:
+        job.delete()
+        metrics.inc('jobs_total', job=job.name, status='done')
+        return True
+    job.last_error = error
+    job.locked_until = None
+    if job.attempts < settings.JOBS_MAX_ATTEMPTS:
+        job.status = Job.QUEUED
+        job.run_at = timezone.now() + timedelta(seconds=retry_delay(job))
+        status = 'retry'
+    else:
+        job.status = Job.FAILED
+        status = 'failed'
+    job.save()
+    metrics.inc('jobs_total', job=job.name, status=status)
+    return True
+
+
+def retry_delay(job):
+    """Пауза перед повтором растёт вдвое с каждой попыткой."""
+    return settings.JOBS_RETRY_DELAY * 2 ** (job.attempts - 1)
@@ -0,0 +1,109 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import jobs
+
+logger = logging.getLogger(__name__)
+
+
+def safely(func, *args):
+    """Сбой одной задачи пишется в лог и не останавливает воркер."""
+    try:
+        return func(*args)
+    except Exception:
+        logger.exception('Сбой при обработке задачи')
+        return None
+
+
+def make_pool(processes):
+    # Соединения родителя не должны достаться процессам пула.
+    connections.close_all()
+    return ProcessPoolExecutor(
+        processes,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    )
+
+
+def run_in_pool(pool, claimed):
+    """Выполняет задачи в пуле: (результаты, сломан ли пул)."""
+    try:
+        futures = [pool.submit(jobs.execute, *job) for job in claimed]
+    except BrokenProcessPool:
+        return [], True
+    results = []
+    broken = False
+    for future in futures:
+        try:
+            results.append(future.result())
+        except BrokenProcessPool:
+            broken = True
+        except Exception:
+            logger.exception('Сбой при обработке задачи')
+    return results, broken
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из очереди в пуле процессов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count(),
+            help='Размер пула; 0 -- выполнять задачи в этом процессе.',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Пауза в секундах, когда очередь пуста.',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Выполнить готовые задачи и выйти.',
+        )
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        pool = make_pool(processes) if processes > 0 else None
+        done = 0
+        try:
+            while True:
+                claimed = jobs.claim(max(processes, 1) * 2)
+                if not claimed:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                if pool is None:
+                    results = [
+                        safely(jobs.execute, *job) for job in claimed
+                    ]
+                else:
+                    results, broken = run_in_pool(pool, claimed)
+                    if broken:
+                        # Процесс пула умер (например, от нехватки
+                        # памяти): его задачи вернутся в очередь, когда
+                        # истечёт аренда.
+                        logger.error('Пул процессов сломан, пересоздаём')
+                        pool.shutdown(wait=False)
+                        pool = make_pool(processes)
+                for result in results:
+                    if result is not None and safely(jobs.finish, *result):
+                        done += 1
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(f'Обработано задач: {done}'))
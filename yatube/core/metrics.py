@@ -0,0 +1,232 @@
+"""Реестр метрик: счётчики, значения и гистограммы.
+
+Каждый процесс копит метрики в памяти. С METRICS_DIR процесс раз в
+METRICS_FLUSH_INTERVAL секунд и при выходе сбрасывает свой реестр в
+<METRICS_DIR>/<pid>.json, а prometheus() складывает файлы всех
+процессов -- веб-воркеров и runworker: счётчики и гистограммы
+суммируются, из значений берётся наибольшее.
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+_histograms = {}
+# Процесс, которому принадлежит реестр, и запущен ли в нём сброс.
+_pid = os.getpid()
+_flushing = False
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _prepare():
+    """Вызывается под _lock перед каждым изменением реестра."""
+    global _pid, _flushing
+    if _pid != os.getpid():
+        # Процесс после fork: метрики родителя -- в его файле.
+        _pid = os.getpid()
+        _flushing = False
+        _clear()
+    if not _flushing and settings.METRICS_DIR:
+        _flushing = True
+        threading.Thread(
+            target=_flush_forever, name='metrics-flush', daemon=True
+        ).start()
+
+
+def inc(name, value=1, **labels):
+    with _lock:
+        _prepare()
+        _counters[_key(name, labels)] += value
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _prepare()
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _prepare()
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {
+                'buckets': tuple(buckets),
+                'counts': [0] * len(buckets),
+                'sum': 0,
+                'count': 0,
+            }
+        index = bisect.bisect_left(histogram['buckets'], value)
+        if index < len(histogram['counts']):
+            histogram['counts'][index] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+def snapshot():
+    """Копия всех метрик: {'counters': ..., 'gauges': ..., ...}."""
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'histograms': {
+                key: dict(value, counts=list(value['counts']))
+                for key, value in _histograms.items()
+            },
+        }
+
+
+def _clear():
+    _counters.clear()
+    _gauges.clear()
+    _histograms.clear()
+
+
+def reset():
+    with _lock:
+        _clear()
+
+
+def flush():
+    """Записывает реестр процесса в METRICS_DIR/<pid>.json."""
+    directory = settings.METRICS_DIR
+    if not directory or _pid != os.getpid():
+        return
+    data = snapshot()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{_pid}.json')
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as stream:
+        json.dump({
+            kind: [[name, labels, value]
+                   for (name, labels), value in values.items()]
+            for kind, values in data.items()
+        }, stream)
+    os.replace(temporary, path)
+
+
+def _flush_forever():
+    atexit.register(flush)
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            logger.warning('Не удалось сбросить метрики', exc_info=True)
+
+
+def _load(path):
+    """Реестр процесса из файла или None, если файл не прочитать."""
+    try:
+        with open(path, encoding='utf-8') as stream:
+            data = json.load(stream)
+    except (OSError, ValueError):
+        return None
+    return {
+        kind: {
+            (name, tuple(map(tuple, labels))): value
+            for name, labels, value in values
+        }
+        for kind, values in data.items()
+    }
+
+
+def _merge(total, data):
+    for key, value in data['counters'].items():
+        total['counters'][key] = total['counters'].get(key, 0) + value
+    for key, value in data['gauges'].items():
+        total['gauges'][key] = max(total['gauges'].get(key, value), value)
+    for key, histogram in data['histograms'].items():
+        merged = total['histograms'].get(key)
+        if merged is None:
+            total['histograms'][key] = dict(
+                histogram, counts=list(histogram['counts'])
+            )
+        elif merged['buckets'] == histogram['buckets']:
+            merged['counts'] = [
+                a + b for a, b in zip(merged['counts'], histogram['counts'])
+            ]
+            merged['sum'] += histogram['sum']
+            merged['count'] += histogram['count']
+
+
+def collect():
+    """Метрики всех процессов из METRICS_DIR; без него -- этого."""
+    directory = settings.METRICS_DIR
+    if not directory:
+        return snapshot()
+    flush()
+    total = {'counters': {}, 'gauges': {}, 'histograms': {}}
+    for name in sorted(os.listdir(directory)):
+        data = name.endswith('.json') and _load(
+            os.path.join(directory, name)
+        )
+        if data:
+            _merge(total, data)
+    return total
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n')
+
+
+def _labels(labels, **extra):
+    pairs = labels + tuple(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        f'{name}="{_escape(value)}"' for name, value in pairs
+    ) + '}'
+
+
+def prometheus():
+    """Все метрики в текстовом формате Prometheus 0.0.4."""
+    data = collect()
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f'# TYPE {name} {kind}')
+
+    for kind, values in (
+        ('counter', data['counters']), ('gauge', data['gauges']),
+    ):
+        for (name, labels), value in sorted(values.items()):
+            declare(name, kind)
+            lines.append(f'{name}{_labels(labels)} {value}')
+    for (name, labels), histogram in sorted(data['histograms'].items()):
+        declare(name, 'histogram')
+        total = 0
+        for bound, count in zip(histogram['buckets'], histogram['counts']):
+            total += count
+            lines.append(
+                f'{name}_bucket{_labels(labels, le=bound)} {total}'
+            )
+        lines.append(
+            f'{name}_bucket{_labels(labels, le="+Inf")} {histogram["count"]}'
+        )
+        lines.append(f'{name}_sum{_labels(labels)} {histogram["sum"]}')
+        lines.append(f'{name}_count{_labels(labels)} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
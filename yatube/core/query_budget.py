@@ -0,0 +1,113 @@
+"""Бюджет SQL-запросов для представлений.
+
+    @query_budget(4)
+    def index(request):
+        ...
+
+Если представление сделало больше запросов, чем объявлено, при
+QUERY_BUDGET_STRICT поднимается QueryBudgetExceeded (так тесты ловят
+N+1), иначе превышение пишется в лог. У пишущих представлений бюджет
+ставится под @transaction.atomic, чтобы превышение откатило запись, а
+не отдало 500 на уже сохранённое действие.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_STATEMENTS = (
+    'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE',
+)
+
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def exempt():
+    """Запросы внутри блока не входят в бюджет представления.
+
+    Нужно для работы, которая выполняется в запросе лишь потому, что
+    фоновые задачи запущены без воркера (JOBS_EAGER).
+    """
+    previous = getattr(_local, 'exempt', False)
+    _local.exempt = True
+    try:
+        yield
+    finally:
+        _local.exempt = previous
+
+
+class QueryCounter:
+    """Считает запросы, прошедшие через соединение с базой.
+
+    Не считаются управление транзакциями (BEGIN, SAVEPOINT, ...) и
+    запросы к таблицам из QUERY_BUDGET_IGNORE_TABLES.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.ignore = tuple(
+            f'"{table}"' for table in settings.QUERY_BUDGET_IGNORE_TABLES
+        )
+
+    def __call__(self, execute, sql, params, many, context):
+        if not (
+            getattr(_local, 'exempt', False)
+            or sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS)
+            or any(table in sql for table in self.ignore)
+        ):
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+def query_budget(max_queries):
+    """Бюджет запросов представления.
+
+    У потокового ответа запросы идут и при чтении тела, поэтому счёт
+    продолжается, пока тело не дочитано, и проверяется в конце.
+    """
+    def decorator(view):
+        def check(counter):
+            if counter.count <= max_queries:
+                return
+            message = (
+                f'{view.__module__}.{view.__name__}: '
+                f'{counter.count} SQL-запросов при бюджете {max_queries}'
+            )
+            metrics.inc('query_budget_exceeded_total', view=view.__name__)
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        def counted(content, counter):
+            with connection.execute_wrapper(counter):
+                yield from content
+            check(counter)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                response = view(request, *args, **kwargs)
+            if response.streaming:
+                response.streaming_content = counted(
+                    response.streaming_content, counter
+                )
+            else:
+                check(counter)
+            return response
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
@@ -0,0 +1,125 @@
+"""Журнал медленных SQL-запросов.
+
+Запрос дольше SLOW_QUERY_THRESHOLD секунд пишется в лог вместе с
+представлением и шаблоном, из которых он пришёл, и планом EXPLAIN.
+Полный просмотр таблиц из SLOW_QUERY_SCAN_TABLES отмечается отдельно:
+обычно это значит, что запросу не хватает индекса.
+"""
+import logging
+import re
+import time
+
+from django.conf import settings
+
+from core import instrumentation, metrics
+
+logger = logging.getLogger(__name__)
+
+# Полный просмотр таблицы без индекса. SQLite: "SCAN posts_post"
+# (старые версии -- "SCAN TABLE posts_post"); "SCAN ... USING INDEX"
+# идёт по индексу в его порядке и полным просмотром не считается.
+# PostgreSQL: "Seq Scan on posts_post".
+FULL_SCAN_RE = re.compile(
+    r'^(?:SCAN (?:TABLE )?(\w+)(?: AS \w+)?$'
+    r'|[\s>-]*Seq Scan on "?(\w+))'
+)
+
+
+def explain(connection, sql, params):
+    """Строки плана запроса; None, если объяснить не удалось.
+
+    Курсор берётся в обход обёрток Django, чтобы EXPLAIN не попал ни в
+    журнал, ни в счётчики запросов.
+    """
+    cursor = connection.create_cursor()
+    try:
+        query = f'{connection.ops.explain_query_prefix()} {sql}'
+        if params is None:
+            cursor.execute(query)
+        else:
+            cursor.execute(query, params)
+        return [str(row[-1]) for row in cursor.fetchall()]
+    except Exception:
+        logger.debug('Не удалось получить план %s', sql, exc_info=True)
+        return None
+    finally:
+        cursor.close()
+
+
+def scanned_table(line):
+    """Таблица, которую строка плана читает целиком, или None."""
+    match = FULL_SCAN_RE.match(line)
+    return match and (match.group(1) or match.group(2))
+
+
+def full_scans(plan):
+    """Таблицы из SLOW_QUERY_SCAN_TABLES, которые план читает целиком."""
+    return [
+        table for table in map(scanned_table, plan)
+        if table in settings.SLOW_QUERY_SCAN_TABLES
+    ]
+
+
+def origin():
+    """(представление, шаблон) текущего запроса, если они известны."""
+    timings = instrumentation.current()
+    if timings is None:
+        return None, None
+    template = timings.templates[-1] if timings.templates else None
+    return timings.view, template
+
+
+def record(connection, sql, params, many, duration):
+    view, template = origin()
+    plan = None
+    scans = []
+    if (
+        settings.SLOW_QUERY_EXPLAIN and not many
+        and sql.lstrip().upper().startswith('SELECT')
+    ):
+        plan = explain(connection, sql, params)
+        scans = full_scans(plan or ())
+    metrics.inc('slow_queries_total', view=view or '-')
+    for table in scans:
+        metrics.inc('slow_query_full_scans_total', table=table)
+    logger.warning(
+        'Медленный запрос %.1f мс (представление %s, шаблон %s)%s: %s%s',
+        duration * 1000,
+        view or '-',
+        template or '-',
+        ''.join(f', полный просмотр {table}' for table in scans),
+        sql,
+        ''.join(f'\n    {line}' for line in plan or ()),
+        extra={
+            'sql': sql,
+            'duration': duration,
+            'view': view,
+            'template': template,
+            'plan': plan,
+            'full_scans': scans,
+        },
+    )
+
+
+def recorder(execute, sql, params, many, context):
+    """execute_wrapper: замеряет запрос и пишет медленный в журнал."""
+    threshold = settings.SLOW_QUERY_THRESHOLD
+    if threshold is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        if duration >= threshold:
+            record(context['connection'], sql, params, many, duration)
+
+
+def install(sender, connection, **kwargs):
+    """Приёмник connection_created: ставит recorder на соединение.
+
+    Обёртка живёт на объекте соединения Django и переживает
+    переподключения, поэтому второй раз не добавляется.
+    """
+    if recorder not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, recorder)
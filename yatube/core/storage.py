@@ -0,0 +1,124 @@
+"""Хранилище файлов с адресацией по содержимому.
+
+Файл называется по SHA-256 своего содержимого и лежит в подкаталогах
+по первым символам хеша: posts/photo.webp -> posts/3f/a9/3fa9....webp.
+Повторная загрузка того же файла не пишет его заново, а возвращает уже
+сохранённое имя. Сколько записей ссылается на файл, хранит MediaFile:
+retain() и release() вызываются при появлении и исчезновении ссылки;
+файл без ссылок удаляется вместе со строкой фоновой задачей.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.db.models import F
+
+from core.models import MediaFile
+
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+CONTENT_NAME_RE = re.compile(
+    r'^(?:.+/)?' + rf'[0-9a-f]{{{SHARD_WIDTH}}}/' * SHARD_DEPTH
+    + r'[0-9a-f]{64}(?:\.\w+)?$'
+)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name) and self.pin(name):
+            return name
+        return self._save(name, content)
+
+    def pin(self, name):
+        """Не даёт удалить уже сохранённый файл, пока идёт транзакция.
+
+        Пустой UPDATE строки MediaFile берёт блокировку записи, которую
+        ждёт удаление файла (см. posts.thumbnails.delete_image). После неё
+        файл проверяется ещё раз: если его успели удалить, он пишется
+        заново. Защищает до конца транзакции, в которой сохраняется
+        запись со ссылкой на файл.
+        """
+        MediaFile.objects.filter(name=name).update(refs=F('refs'))
+        return self.exists(name)
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        shards = [
+            digest[index * SHARD_WIDTH:(index + 1) * SHARD_WIDTH]
+            for index in range(SHARD_DEPTH)
+        ]
+        extension = os.path.splitext(name)[1].lower()
+        parts = [*shards, f'{digest}{extension}']
+        directory = os.path.dirname(name)
+        if directory:
+            parts.insert(0, directory)
+        return '/'.join(parts)
+
+    def _save(self, name, content):
+        # Одинаковое содержимое можно записывать одновременно: файл
+        # пишется во временный и атомарно переименовывается.
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    temp_file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+
+def is_content_name(name):
+    return bool(CONTENT_NAME_RE.match(name or ''))
+
+
+def retain(name):
+    """Ещё одна запись ссылается на файл name."""
+    if not is_content_name(name):
+        return
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(MediaFile._meta.db_table)} '
+            f'({quote("name")}, {quote("refs")}) VALUES (%s, 1) '
+            f'ON CONFLICT ({quote("name")}) '
+            f'DO UPDATE SET {quote("refs")} = '
+            f'{quote(MediaFile._meta.db_table)}.{quote("refs")} + 1',
+            [name],
+        )
+
+
+def release(name):
+    """Ссылкой на файл меньше; True, если это была последняя.
+
+    Строка с нулём ссылок остаётся: её удаляет задача, удаляющая файл,
+    и только если к тому времени ссылок так и не появилось. Файлы,
+    сохранённые до этого хранилища, не считаются и никогда не
+    освобождаются.
+    """
+    if not is_content_name(name):
+        return False
+    if not MediaFile.objects.filter(name=name, refs__gt=0).update(
+        refs=F('refs') - 1
+    ):
+        return False
+    return not MediaFile.objects.filter(name=name, refs__gt=0).exists()
@@ -0,0 +1,320 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core import jobs, metrics, slow_queries
+from core.instrumentation import InstrumentationMiddleware
+from core.management.commands import runworker
+from core.models import Job
+from core.query_budget import QueryBudgetExceeded, exempt, query_budget
+from posts.models import Comment, Post, User
+
+CALLS = []
+
+
+@jobs.task
+def remember(value):
+    CALLS.append(value)
+
+
+@jobs.task
+def explode():
+    raise RuntimeError('Задача упала')
+
+
+def make_view(budget, queries):
+    @query_budget(budget)
+    def view(request):
+        for _ in range(queries):
+            User.objects.exists()
+        return HttpResponse()
+    return view
+
+
+@override_settings(METRICS_TOKEN='secret')
+class InstrumentationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    def test_server_timing_and_metrics(self):
+        """Замеры уходят в Server-Timing и в /metrics по имени view."""
+        response = self.client.get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        for part in ('sql;dur=', 'queries"', 'tpl;dur=', 'misses"',
+                     'total;dur='):
+            self.assertIn(part, timing)
+        self.assertIn('0 queries', self.client.get(
+            reverse('posts:index'))['Server-Timing'])
+        body = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret'
+        ).content.decode()
+        self.assertIn(
+            'http_requests_total{method="GET",status="200",'
+            'view="posts:index"} 2', body
+        )
+        self.assertIn(
+            'http_request_duration_seconds_count{view="posts:index"} 2',
+            body,
+        )
+        self.assertIn('cache_requests_total{result="hit",'
+                      'view="posts:index"}', body)
+        self.assertIn('# TYPE db_queries_per_request histogram', body)
+
+    def test_metrics_require_token(self):
+        """Без верного токена /metrics закрыт и для локального адреса."""
+        for token, header in (
+            (None, ''), ('secret', ''), ('secret', 'Bearer wrong'),
+            (None, 'Bearer None'),
+        ):
+            with self.subTest(token=token, header=header), \
+                    override_settings(METRICS_TOKEN=token):
+                response = self.client.get(
+                    reverse('metrics'), REMOTE_ADDR='127.0.0.1',
+                    HTTP_AUTHORIZATION=header,
+                )
+                self.assertEqual(response.status_code, 403)
+
+    def test_metrics_of_all_processes(self):
+        """С METRICS_DIR /metrics складывает метрики всех процессов."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with override_settings(METRICS_DIR=directory):
+            metrics.inc('jobs_total', job='remember', status='done')
+            metrics.observe('job_duration_seconds', 0.2, job='remember')
+            metrics.flush()
+            # Файл другого процесса, например runworker.
+            os.rename(
+                os.path.join(directory, f'{os.getpid()}.json'),
+                os.path.join(directory, '1.json'),
+            )
+            metrics.reset()
+            metrics.inc('jobs_total', job='remember', status='done')
+            body = self.client.get(
+                reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret'
+            ).content.decode()
+        self.assertIn(
+            'jobs_total{job="remember",status="done"} 2.0', body
+        )
+        self.assertIn(
+            'job_duration_seconds_count{job="remember"} 1', body
+        )
+
+
+@override_settings(SLOW_QUERY_THRESHOLD=0)
+class SlowQueryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_full_scan_is_flagged(self):
+        """Полный просмотр posts_post попадает в журнал с планом."""
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            list(Post.objects.filter(text__contains='пост').order_by())
+        record = logs.records[-1]
+        self.assertEqual(record.full_scans, ['posts_post'])
+        self.assertIn('полный просмотр posts_post', record.getMessage())
+
+    def test_index_scan_is_not_flagged(self):
+        """Проход по индексу (SCAN ... USING INDEX) -- не полный просмотр."""
+        self.assertEqual(slow_queries.full_scans([
+            'SCAN posts_post USING INDEX posts_post_pub_date_abc',
+            'SCAN posts_comment USING COVERING INDEX comment_idx',
+            'SEARCH posts_follow USING INDEX follow_idx (user_id=?)',
+        ]), [])
+        self.assertEqual(slow_queries.full_scans([
+            'SCAN TABLE posts_post', 'SCAN posts_comment AS c',
+            '  ->  Seq Scan on posts_follow  (cost=0.00..1.01 rows=1)',
+        ]), ['posts_post', 'posts_comment', 'posts_follow'])
+
+    def test_view_is_logged(self):
+        """В журнале видно представление, откуда пришёл запрос."""
+        user = User.objects.create_user(username='author')
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            self.client.get(reverse('posts:profile', args=[user.username]))
+        self.assertIn(
+            'posts:profile', {record.view for record in logs.records}
+        )
+
+    def test_template_is_logged(self):
+        """Запрос ленивого queryset из шаблона помечается шаблоном."""
+        def view(request):
+            return HttpResponse(render_to_string(
+                'posts/includes/comment_list.html',
+                {'comments': Comment.objects.all()},
+            ))
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            InstrumentationMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(
+            [record.template for record in logs.records],
+            ['posts/includes/comment_list.html'],
+        )
+
+
+class QueryBudgetTest(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+
+    def test_view_within_budget(self):
+        """Представление в рамках бюджета работает как обычно."""
+        view = make_view(2, 2)
+        self.assertEqual(view.query_budget, 2)
+        view(self.request)
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_view_over_budget_raises(self):
+        """Превышение бюджета в строгом режиме — ошибка."""
+        with self.assertRaises(QueryBudgetExceeded):
+            make_view(1, 2)(self.request)
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_exempt_queries_are_not_counted(self):
+        """Запросы внутри exempt() бюджет не расходуют."""
+        @query_budget(0)
+        def view(request):
+            with exempt():
+                User.objects.exists()
+            return HttpResponse()
+
+        view(self.request)
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_view_over_budget_rolls_back(self):
+        """Превышение под transaction.atomic откатывает запись."""
+        @transaction.atomic
+        @query_budget(1)
+        def view(request):
+            User.objects.create_user(username='budget')
+            User.objects.create_user(username='budget2')
+            return HttpResponse()
+
+        with self.assertRaises(QueryBudgetExceeded):
+            view(self.request)
+        self.assertFalse(User.objects.filter(username='budget').exists())
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_streaming_body_is_counted(self):
+        """Запросы при чтении потокового ответа тоже входят в бюджет."""
+        @query_budget(1)
+        def view(request):
+            return StreamingHttpResponse(
+                str(User.objects.exists()) for _ in range(2)
+            )
+
+        response = view(self.request)
+        with self.assertRaises(QueryBudgetExceeded):
+            b''.join(response.streaming_content)
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_view_over_budget_logs(self):
+        """Без строгого режима превышение только пишется в лог."""
+        with self.assertLogs('core.query_budget', 'WARNING'):
+            make_view(1, 2)(self.request)
+
+
+def run_worker():
+    call_command('runworker', processes=0, once=True, stdout=StringIO())
+
+
+@override_settings(JOBS_EAGER=False, JOBS_MAX_ATTEMPTS=2)
+class JobQueueTest(TestCase):
+    def setUp(self):
+        CALLS.clear()
+        metrics.reset()
+
+    def test_worker_runs_queued_jobs(self):
+        """Поставленная задача выполняется воркером и удаляется."""
+        jobs.enqueue(remember, 'раз')
+        self.assertEqual(CALLS, [])
+        run_worker()
+        self.assertEqual(CALLS, ['раз'])
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(
+            metrics.snapshot()['counters'][
+                ('jobs_total', (('job', remember.job_name),
+                                ('status', 'done')))],
+            1,
+        )
+
+    def test_failed_job_is_retried_with_backoff(self):
+        """Упавшая задача откладывается, после всех попыток -- FAILED."""
+        job = jobs.enqueue(explode)
+        run_worker()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('Задача упала', job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+        run_worker()
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 1)
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        run_worker()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_expired_lease_is_reclaimed(self):
+        """Задачу, брошенную упавшим воркером, забирает другой."""
+        job = jobs.enqueue(remember, 'два')
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING, locked_until=timezone.now())
+        run_worker()
+        self.assertEqual(CALLS, ['два'])
+
+    def test_lost_lease_result_is_dropped(self):
+        """Результат задачи, забранной другим воркером, отбрасывается."""
+        job = jobs.enqueue(remember, 'три')
+        [(job_id, lease)] = jobs.claim(1)
+        heartbeat = jobs.Heartbeat(job_id, lease)
+        self.assertTrue(heartbeat.renew())
+        self.assertGreater(heartbeat.lease, lease)
+        with self.assertLogs('core.jobs', 'WARNING'):
+            self.assertFalse(jobs.finish(job_id, lease, '', 0))
+        self.assertTrue(jobs.finish(job_id, heartbeat.lease, '', 0))
+        self.assertFalse(Job.objects.filter(pk=job.pk).exists())
+        self.assertFalse(heartbeat.renew())
+
+    def test_worker_survives_deleted_job(self):
+        """Задача, удалённая во время выполнения, не роняет воркер."""
+        jobs.enqueue(remember, 'четыре')
+        [claimed] = jobs.claim(1)
+        result = jobs.execute(*claimed)
+        Job.objects.all().delete()
+        with self.assertLogs('core.jobs', 'WARNING'):
+            self.assertFalse(jobs.finish(*result))
+        self.assertEqual(CALLS, ['четыре'])
+
+    def test_abandoned_job_fails_after_max_attempts(self):
+        """Задача, раз за разом ронявшая воркер, становится FAILED."""
+        job = jobs.enqueue(remember, 'пять')
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.RUNNING, attempts=2, locked_until=timezone.now())
+        run_worker()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(CALLS, [])
+
+    def test_broken_pool_is_reported(self):
+        """Умерший процесс пула не роняет воркер, а сообщает о поломке."""
+        class BrokenPool:
+            def submit(self, func, *args):
+                future = Future()
+                future.set_exception(BrokenProcessPool('Процесс умер'))
+                return future
+
+        self.assertEqual(
+            runworker.run_in_pool(BrokenPool(), [(1, None)]), ([], True)
+        )
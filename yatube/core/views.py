@@ -1,5 +1,12 @@
+import hmac
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
 
+from core import metrics as registry
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -15,3 +22,21 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def metrics(request):
+    """Метрики для Prometheus; только с заголовком Bearer METRICS_TOKEN.
+
+    Адрес клиента не проверяется: за прокси на той же машине он всегда
+    локальный.
+    """
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not token or not hmac.compare_digest(
+        header.encode(), f'Bearer {token}'.encode()
+    ):
+        raise PermissionDenied
+    return HttpResponse(
+        registry.prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,347 @@
+"""JSON API только для чтения: посты, группы, профили, комментарии.
+
+Списки листаются курсором по ключу сортировки (?after=...), поля
+выбираются параметром ?fields=id,text,author. Строки читаются через
+values() только с нужными колонками, без создания объектов моделей.
+ETag считается по версиям лент (см. feed_cache) до выборки данных.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, quote_etag
+from django.views.decorators.http import require_safe
+
+from core.query_budget import query_budget
+from posts import feed_cache
+from posts.models import Comment, Group, Post, User
+from posts.paginators import decode_cursor, encode_cursor, keyset
+from posts.stats import get_stats, stats_feed
+from posts.timeline import feed_paginator
+
+POST_ORDERING = ('-pub_date', '-id')
+COMMENT_ORDERING = ('-created', '-id')
+GROUP_ORDERING = ('title', 'id')
+
+
+def image_url(name):
+    return Post._meta.get_field('image').storage.url(name) if name else None
+
+
+# Поле ответа -> (колонка для values(), преобразование значения).
+POST_FIELDS = {
+    'id': ('id', None),
+    'text': ('text', None),
+    'pub_date': ('pub_date', None),
+    'author': ('author__username', None),
+    'group': ('group__slug', None),
+    'image': ('image', image_url),
+    'image_width': ('image_width', None),
+    'image_height': ('image_height', None),
+}
+COMMENT_FIELDS = {
+    'id': ('id', None),
+    'post': ('post_id', None),
+    'author': ('author__username', None),
+    'text': ('text', None),
+    'created': ('created', None),
+}
+GROUP_FIELDS = {
+    'id': ('id', None),
+    'slug': ('slug', None),
+    'title': ('title', None),
+    'description': ('description', None),
+}
+PROFILE_FIELDS = {
+    'id': ('id', None),
+    'username': ('username', None),
+    'first_name': ('first_name', None),
+    'last_name': ('last_name', None),
+}
+STATS_FIELDS = (
+    'post_count', 'follower_count', 'following_count', 'comment_count',
+)
+
+
+class ApiError(Exception):
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def api_view(view):
+    """GET/HEAD-представление API: ошибки тоже отдаются в JSON."""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except Http404:
+            return JsonResponse({'detail': 'Не найдено.'}, status=404)
+        except ApiError as error:
+            return JsonResponse({'detail': error.detail}, status=error.status)
+    return wrapper
+
+
+def respond(request, get_data, *feeds):
+    """Ответ get_data() с ETag; для 304 данные не выбираются.
+
+    Без feeds ETag считается по телу ответа.
+    """
+    etag = None
+    if feeds:
+        etag = quote_etag(
+            feed_cache.etag(request, *feeds, per_user=False))
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            response['ETag'] = etag
+            return response
+    response = JsonResponse(
+        get_data(), json_dumps_params={'ensure_ascii': False}
+    )
+    if etag is None:
+        etag = quote_etag(hashlib.md5(response.content).hexdigest())
+    response['ETag'] = etag
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def requested_fields(request, spec):
+    """Имена полей из ?fields=, по умолчанию -- все поля spec."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(spec)
+    names = list(dict.fromkeys(
+        name.strip() for name in raw.split(',') if name.strip()
+    ))
+    unknown = [name for name in names if name not in spec]
+    if unknown or not names:
+        raise ApiError(
+            400, f'Неизвестные поля: {", ".join(unknown) or raw}.'
+        )
+    return names
+
+
+def serialize(row, spec, names, get=dict.get):
+    """Поля names строки row; get читает колонку из строки."""
+    data = {}
+    for name in names:
+        column, convert = spec[name]
+        value = get(row, column)
+        data[name] = convert(value) if convert else value
+    return data
+
+
+def attribute(obj, column):
+    """Значение колонки values() у объекта модели: author__username."""
+    for part in column.split('__'):
+        if obj is None:
+            return None
+        obj = getattr(obj, part)
+    return obj
+
+
+def next_url(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['after'] = cursor
+    return f'{request.path}?{params.urlencode()}'
+
+
+def after_cursor(request):
+    """Значения курсора ?after=, None для первой страницы."""
+    after = request.GET.get('after')
+    if not after:
+        return None
+    values = decode_cursor(after)
+    if values is None:
+        raise ApiError(400, 'Неверный курсор.')
+    return values
+
+
+def cursor_list(request, queryset, spec, ordering):
+    """Страница queryset после курсора ?after= в виде словарей."""
+    names = requested_fields(request, spec)
+    key = [name.lstrip('-') for name in ordering]
+    columns = {spec[name][0] for name in names} | set(key)
+    rows = keyset(
+        queryset.values(*columns),
+        ordering,
+        after_cursor(request),
+        False,
+        settings.API_PAGE_SIZE + 1,
+    )
+    if rows is None:
+        raise ApiError(400, 'Неверный курсор.')
+    cursor = None
+    if len(rows) > settings.API_PAGE_SIZE:
+        rows = rows[:settings.API_PAGE_SIZE]
+        cursor = encode_cursor([rows[-1][column] for column in key])
+    return {
+        'results': [serialize(row, spec, names) for row in rows],
+        'next': next_url(request, cursor),
+    }
+
+
+@api_view
+@query_budget(1)
+def posts(request):
+    return respond(
+        request,
+        lambda: cursor_list(
+            request, Post.objects.all(), POST_FIELDS, POST_ORDERING
+        ),
+        ('index',),
+    )
+
+
+@api_view
+@query_budget(1)
+def post_detail(request, post_id):
+    names = requested_fields(request, POST_FIELDS)
+    row = Post.objects.filter(pk=post_id).values(
+        'author_id', *{POST_FIELDS[name][0] for name in names}
+    ).first()
+    if row is None:
+        raise Http404
+    return respond(
+        request,
+        lambda: serialize(row, POST_FIELDS, names),
+        ('profile', row['author_id']),
+    )
+
+
+@api_view
+@query_budget(2)
+def post_comments(request, post_id):
+    author_id = Post.objects.filter(pk=post_id).values_list(
+        'author_id', flat=True).first()
+    if author_id is None:
+        raise Http404
+    return respond(
+        request,
+        lambda: cursor_list(
+            request,
+            Comment.objects.filter(post_id=post_id),
+            COMMENT_FIELDS,
+            COMMENT_ORDERING,
+        ),
+        ('profile', author_id),
+    )
+
+
+@api_view
+@query_budget(1)
+def groups(request):
+    return respond(
+        request,
+        lambda: cursor_list(
+            request, Group.objects.all(), GROUP_FIELDS, GROUP_ORDERING
+        ),
+        ('groups',),
+    )
+
+
+@api_view
+@query_budget(1)
+def group_detail(request, slug):
+    names = requested_fields(request, GROUP_FIELDS)
+    row = Group.objects.filter(slug=slug).values(
+        'id', *{GROUP_FIELDS[name][0] for name in names}
+    ).first()
+    if row is None:
+        raise Http404
+    return respond(
+        request,
+        lambda: serialize(row, GROUP_FIELDS, names),
+        ('group', row['id']),
+    )
+
+
+@api_view
+@query_budget(2)
+def group_posts(request, slug):
+    group_id = get_object_or_404(
+        Group.objects.values_list('pk', flat=True), slug=slug
+    )
+    return respond(
+        request,
+        lambda: cursor_list(
+            request,
+            Post.objects.filter(group_id=group_id),
+            POST_FIELDS,
+            POST_ORDERING,
+        ),
+        ('group', group_id),
+    )
+
+
+@api_view
+@query_budget(3)
+def profile(request, username):
+    spec = dict(PROFILE_FIELDS, **{
+        counter: (counter, None) for counter in STATS_FIELDS
+    })
+    names = requested_fields(request, spec)
+    author = get_object_or_404(
+        User.objects.only(*(column for column, _ in PROFILE_FIELDS.values())),
+        username=username,
+    )
+
+    def get_data():
+        stats = get_stats(author)
+        return serialize(
+            author,
+            spec,
+            names,
+            lambda user, column: getattr(
+                stats if column in STATS_FIELDS else user, column
+            ),
+        )
+
+    return respond(request, get_data, stats_feed(author.pk))
+
+
+@api_view
+@query_budget(2)
+def profile_posts(request, username):
+    author_id = get_object_or_404(
+        User.objects.values_list('pk', flat=True), username=username
+    )
+    return respond(
+        request,
+        lambda: cursor_list(
+            request,
+            Post.objects.filter(author_id=author_id),
+            POST_FIELDS,
+            POST_ORDERING,
+        ),
+        ('profile', author_id),
+    )
+
+
+@api_view
+@query_budget(6)
+def follow(request):
+    """Лента подписок: посты уже собраны пагинатором ленты."""
+    if not request.user.is_authenticated:
+        raise ApiError(401, 'Нужна авторизация.')
+    names = requested_fields(request, POST_FIELDS)
+
+    def get_data():
+        paginator = feed_paginator(request.user, settings.API_PAGE_SIZE)
+        page = paginator.cursor_page(after_cursor(request))
+        if page is None:
+            raise ApiError(400, 'Неверный курсор.')
+        return {
+            'results': [
+                serialize(post, POST_FIELDS, names, attribute)
+                for post in page
+            ],
+            'next': next_url(request, page.next_cursor),
+        }
+
+    return respond(request, get_data)
@@ -0,0 +1,170 @@
+"""Замеры представлений posts через тестовый клиент.
+
+Каждый сценарий -- запрос к одному представлению от имени подходящего
+пользователя засеянной базы (см. seed_yatube). Для сценария считаются
+перцентили времени ответа, запросы к базе и размер ответа; итог можно
+сохранить как базовую линию и сравнивать с ней следующие прогоны.
+
+Тёплый прогон идёт с кешами, как на сайте; холодный (сценарий
+<имя>/cold) -- без кеша страниц и кеша версий, так что видны все
+запросы представления.
+"""
+import json
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from posts.models import Group, Post, User
+
+PERCENTILES = (50, 95, 99)
+SCENARIOS = (
+    'index', 'group_posts', 'profile', 'post_detail', 'follow_index',
+    'add_comment',
+)
+MODES = ('warm', 'cold')
+COLD_SUFFIX = '/cold'
+
+# Без кеша страниц и кеша версий представления делают все свои запросы.
+COLD = {
+    'CACHES': {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        },
+    },
+    'QUERY_BUDGET_STRICT': False,
+}
+
+
+@contextmanager
+def cold():
+    """Настройки холодного прогона; клиентов создавать внутри блока."""
+    middleware = [
+        name for name in settings.MIDDLEWARE
+        if name != 'posts.page_cache.PageCacheMiddleware'
+    ]
+    with override_settings(MIDDLEWARE=middleware, **COLD):
+        yield
+
+
+def scenarios():
+    """Сценарий -> (клиент, метод, адрес, данные) на текущей базе.
+
+    Берутся самые тяжёлые объекты: самая большая группа, самый
+    популярный автор и читатель с наибольшим числом подписок.
+    """
+    group = Group.objects.annotate(
+        total=Count('posts')).order_by('-total').first()
+    author = User.objects.annotate(
+        total=Count('following')).order_by('-total').first()
+    reader = User.objects.annotate(
+        total=Count('follower')).order_by('-total').first()
+    post = Post.objects.order_by('-pub_date').first()
+    if None in (group, author, reader, post):
+        raise ValueError('База пуста: сначала manage.py seed_yatube')
+    guest = Client()
+    client = Client()
+    client.force_login(reader)
+    return {
+        'index': (guest, 'get', reverse('posts:index'), None),
+        'group_posts': (
+            guest, 'get',
+            reverse('posts:group_list', args=[group.slug]), None,
+        ),
+        'profile': (
+            client, 'get',
+            reverse('posts:profile', args=[author.username]), None,
+        ),
+        'post_detail': (
+            client, 'get',
+            reverse('posts:post_detail', args=[post.pk]), None,
+        ),
+        'follow_index': (client, 'get', reverse('posts:follow_index'), None),
+        'add_comment': (
+            client, 'post',
+            reverse('posts:add_comment', args=[post.pk]),
+            {'text': 'Комментарий из замера'},
+        ),
+    }
+
+
+def measure(client, method, url, data, requests, warmup=1):
+    """Замер одного сценария: requests запросов после warmup пробных."""
+    timings = []
+    queries = []
+    sizes = []
+    for number in range(warmup + requests):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise ValueError(f'{url}: ответ {response.status_code}')
+        if number < warmup:
+            continue
+        timings.append(elapsed * 1000)
+        queries.append(len(captured))
+        sizes.append(len(response.content))
+    cuts = statistics.quantiles(timings, n=100, method='inclusive')
+    result = {f'p{p}': round(cuts[p - 1], 3) for p in PERCENTILES}
+    result['queries'] = round(statistics.mean(queries), 2)
+    result['bytes'] = round(statistics.mean(sizes))
+    return result
+
+
+def run(requests, names=SCENARIOS, modes=MODES):
+    """Замеры сценариев names в режимах modes.
+
+    Холодные результаты идут под именами <сценарий>/cold.
+    """
+    results = {}
+    if 'warm' in modes:
+        plans = scenarios()
+        for name in names:
+            results[name] = measure(*plans[name], requests)
+    if 'cold' in modes:
+        with cold():
+            plans = scenarios()
+            for name in names:
+                results[name + COLD_SUFFIX] = measure(*plans[name], requests)
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """Что стало хуже базовой линии больше чем на долю threshold.
+
+    Время сравнивается по p95, число запросов -- строго: любой лишний
+    запрос к базе считается регрессией.
+    """
+    problems = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['p95'] > base['p95'] * (1 + threshold):
+            problems.append(
+                f'{name}: p95 {result["p95"]} мс, было {base["p95"]} мс'
+            )
+        if result['queries'] > base['queries']:
+            problems.append(
+                f'{name}: {result["queries"]} запросов, '
+                f'было {base["queries"]}'
+            )
+    return problems
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as stream:
+        return json.load(stream)
+
+
+def save_baseline(path, results):
+    with open(path, 'w', encoding='utf-8') as stream:
+        json.dump(results, stream, ensure_ascii=False, indent=2)
+        stream.write('\n')
@@ -0,0 +1,331 @@
+"""Файлы выгрузки (export_yatube) и загрузки (import_yatube) контента.
+
+Каждая модель пишется в свой файл <модель>.jsonl или <модель>.csv,
+по желанию сжатый gzip. Пользователи и группы записываются по username
+и slug, а не по id, чтобы выгрузку можно было загрузить в другую базу.
+Посты и комментарии при загрузке получают новые id.
+"""
+import csv
+import gzip
+import json
+import os
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts.models import Comment, Follow, Group, Post, User
+
+FORMATS = ('jsonl', 'csv')
+
+# Имя -> (модель, поле файла -> колонка для values(), поле даты для
+# инкрементальной выгрузки). Порядок -- порядок загрузки.
+MODELS = {
+    'group': (Group, {
+        'id': 'id',
+        'slug': 'slug',
+        'title': 'title',
+        'description': 'description',
+    }, None),
+    'post': (Post, {
+        'id': 'id',
+        'author': 'author__username',
+        'group': 'group__slug',
+        'text': 'text',
+        'pub_date': 'pub_date',
+        'image': 'image',
+    }, 'pub_date'),
+    'comment': (Comment, {
+        'id': 'id',
+        'post': 'post_id',
+        'author': 'author__username',
+        'text': 'text',
+        'created': 'created',
+    }, 'created'),
+    'follow': (Follow, {
+        'user': 'user__username',
+        'author': 'author__username',
+    }, None),
+}
+
+
+def file_name(name, fmt, compress=False):
+    return f'{name}.{fmt}' + ('.gz' if compress else '')
+
+
+def open_text(path, mode, compress=None):
+    """Текстовый файл, сжатый gzip, если так решено или path на .gz."""
+    if compress is None:
+        compress = path.endswith('.gz')
+    if compress:
+        return gzip.open(path, f'{mode}t', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def rows(name, since=None, chunk_size=2000):
+    """Строки модели name словарями, по chunk_size строк из базы.
+
+    Модели без поля даты выгружаются целиком и при since.
+    """
+    model, columns, date_field = MODELS[name]
+    queryset = model.objects.order_by('pk')
+    if since is not None and date_field is not None:
+        queryset = queryset.filter(**{f'{date_field}__gte': since})
+    values = queryset.values_list(*columns.values())
+    for row in values.iterator(chunk_size=chunk_size):
+        yield dict(zip(columns, row))
+
+
+def isoformat(value):
+    return value.isoformat()
+
+
+def dump(stream, name, fmt, records):
+    """Пишет records в открытый stream; возвращает их число."""
+    written = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=list(MODELS[name][1]))
+        writer.writeheader()
+    for record in records:
+        if fmt == 'csv':
+            writer.writerow({
+                field: isoformat(value)
+                if hasattr(value, 'isoformat') else value
+                for field, value in record.items()
+            })
+        else:
+            # isoformat, а не DjangoJSONEncoder: тот обрезает
+            # микросекунды, и даты не пережили бы загрузку обратно.
+            stream.write(json.dumps(
+                record, ensure_ascii=False, default=isoformat
+            ))
+            stream.write('\n')
+        written += 1
+    return written
+
+
+def write(path, name, fmt, records, compress=False):
+    """Пишет records в path через временный файл; возвращает их число.
+
+    Недописанная выгрузка не подменяет прошлую: файл появляется под
+    своим именем, только когда записан целиком, а временный при ошибке
+    удаляется.
+    """
+    temporary = f'{path}.tmp'
+    try:
+        with open_text(temporary, 'w', compress) as stream:
+            written = dump(stream, name, fmt, records)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    os.replace(temporary, path)
+    return written
+
+
+def model_name(path):
+    """Модель файла по его имени: post.jsonl.gz -> 'post'."""
+    name = os.path.basename(path).split('.', 1)[0]
+    return name if name in MODELS else None
+
+
+def read_jsonl(path):
+    with open_text(path, 'r') as stream:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+class Resolver:
+    """id пользователей и групп по username и slug, в памяти.
+
+    Словари читаются из базы один раз; кого нет, создаются пачкой на
+    всю порцию строк, а не по одному на строку.
+    """
+
+    def __init__(self):
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.password = make_password(None)
+        # id поста в файле -> id, под которым он загружен.
+        self.posts = {}
+        self.last_ids = {}
+
+    def allocate(self, model, count):
+        """count новых id модели подряд за последним занятым."""
+        last = self.last_ids.get(model)
+        if last is None:
+            last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        self.last_ids[model] = last + count
+        return range(last + 1, last + count + 1)
+
+    def add_users(self, usernames):
+        missing = set(usernames) - set(self.users)
+        if missing:
+            User.objects.bulk_create(
+                User(username=username, password=self.password)
+                for username in missing
+            )
+            self.users.update(User.objects.filter(
+                username__in=missing).values_list('username', 'pk'))
+
+    def add_groups(self, records):
+        """Создаёт группы из записей {'slug': ..., 'title': ...}."""
+        missing = {
+            record['slug']: record for record in records
+            if record['slug'] not in self.groups
+        }
+        if missing:
+            Group.objects.bulk_create(
+                Group(
+                    slug=slug,
+                    title=record.get('title') or slug,
+                    description=record.get('description') or '',
+                )
+                for slug, record in missing.items()
+            )
+            self.groups.update(Group.objects.filter(
+                slug__in=missing).values_list('slug', 'pk'))
+
+
+def insert(model, objects):
+    """Вставляет объекты со значениями полей как есть, пачками.
+
+    В отличие от bulk_create, pre_save полей не вызывается, и
+    auto_now_add не затирает даты из файла. id у объектов должны быть.
+    """
+    fields = model._meta.concrete_fields
+    quote = connection.ops.quote_name
+    prefix = (
+        f'INSERT INTO {quote(model._meta.db_table)} '
+        f'({", ".join(quote(field.column) for field in fields)}) VALUES '
+    )
+    row = f'({", ".join(["%s"] * len(fields))})'
+    size = connection.ops.bulk_batch_size(fields, objects) or 1
+    with connection.cursor() as cursor:
+        for start in range(0, len(objects), size):
+            batch = objects[start:start + size]
+            cursor.execute(prefix + ', '.join([row] * len(batch)), [
+                field.get_db_prep_save(getattr(obj, field.attname),
+                                       connection)
+                for obj in batch for field in fields
+            ])
+
+
+def reset_sequences():
+    """Сдвигает счётчики id за вставленные явно (PostgreSQL и др.)."""
+    statements = connection.ops.sequence_reset_sql(
+        no_style(), [Post, Comment]
+    )
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def parse_date(value):
+    return parse_datetime(value) if value else timezone.now()
+
+
+def load(name, records, resolver):
+    """Вставляет порцию записей модели name.
+
+    Посты и комментарии получают новые id, так что загрузка не мешает
+    уже опубликованному; комментарии переводятся на новые id постов из
+    этой же загрузки, комментарии к другим постам пропускаются. Даты
+    из файла сохраняются. Возвращает id пользователей, чьи счётчики
+    изменились.
+    """
+    if name == 'group':
+        resolver.add_groups(records)
+        return ()
+    if name == 'follow':
+        resolver.add_users(
+            username for record in records
+            for username in (record['user'], record['author'])
+        )
+        follows = [
+            Follow(
+                user_id=resolver.users[record['user']],
+                author_id=resolver.users[record['author']],
+            )
+            for record in records if record['user'] != record['author']
+        ]
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+        return {
+            user_id for follow in follows
+            for user_id in (follow.user_id, follow.author_id)
+        }
+    resolver.add_users(record['author'] for record in records)
+    if name == 'post':
+        resolver.add_groups(
+            {'slug': record['group']} for record in records
+            if record.get('group')
+        )
+        objects = [
+            Post(
+                id=pk,
+                author_id=resolver.users[record['author']],
+                group_id=resolver.groups.get(record.get('group')),
+                text=record['text'],
+                pub_date=parse_date(record.get('pub_date')),
+                image=record.get('image') or '',
+            )
+            for pk, record in zip(resolver.allocate(Post, len(records)),
+                                  records)
+        ]
+        resolver.posts.update(
+            (record.get('id'), post.pk)
+            for record, post in zip(records, objects)
+        )
+    else:
+        records = [
+            record for record in records if record['post'] in resolver.posts
+        ]
+        objects = [
+            Comment(
+                id=pk,
+                post_id=resolver.posts[record['post']],
+                author_id=resolver.users[record['author']],
+                text=record['text'],
+                created=parse_date(record.get('created')),
+            )
+            for pk, record in zip(resolver.allocate(Comment, len(records)),
+                                  records)
+        ]
+    insert(MODELS[name][0], objects)
+    return {obj.author_id for obj in objects}
+
+
+# Загрузка в SQLite: без fsync на каждую транзакцию, с большим кешем
+# страниц и временными таблицами в памяти.
+SQLITE_LOAD_PRAGMAS = {
+    'synchronous': 'OFF',
+    'cache_size': '-262144',
+    'temp_store': 'MEMORY',
+}
+
+
+@contextmanager
+def load_pragmas():
+    """Настройки SQLite на время загрузки; другие базы не трогает.
+
+    Внутри транзакции SQLite не меняет synchronous, там настройки
+    остаются прежними.
+    """
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        yield
+        return
+    with connection.cursor() as cursor:
+        previous = {}
+        for pragma, value in SQLITE_LOAD_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma}')
+            previous[pragma] = cursor.fetchone()[0]
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+        try:
+            yield
+        finally:
+            for pragma, value in previous.items():
+                cursor.execute(f'PRAGMA {pragma} = {value}')
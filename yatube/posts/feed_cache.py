@@ -0,0 +1,77 @@
+"""Версии лент для кеширования страниц.
+
+Ключ кеша ленты содержит её версию, поэтому фрагменты можно хранить
+долго: любое изменение поста, комментария или группы поднимает версию,
+и старые фрагменты просто перестают читаться.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+
+ALL_FEEDS = ('all',)
+PAGE_PARAMS = ('page', 'after', 'before')
+
+
+def version_key(feed):
+    return ':'.join(['feed-version', *map(str, feed)])
+
+
+def _initial_version():
+    # Начальная версия растёт со временем: после вытеснения счётчика
+    # из кеша ключи не совпадут с ключами уже сохранённых фрагментов.
+    return int(time.time() * 1000)
+
+
+def get_version(*feed):
+    """Версия ленты вместе с общей версией всех лент."""
+    keys = [version_key(ALL_FEEDS), version_key(feed)]
+    versions = cache.get_many(keys)
+    missing = {key: _initial_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def bump(*feeds):
+    """Поднимает версии лент, например bump(('index',), ('group', 1))."""
+    for feed in feeds:
+        key = version_key(feed)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), None)
+
+
+def post_feeds(post, group_id=None):
+    """Ленты, в которых показывается пост."""
+    feeds = [('index',), ('profile', post.author_id)]
+    for pk in {post.group_id, group_id} - {None}:
+        feeds.append(('group', pk))
+    return feeds
+
+
+def fragment_vary_on(feed, request):
+    """Из чего состоит ключ фрагмента: лента, версия и позиция страницы."""
+    return [
+        *feed,
+        get_version(*feed),
+        *(request.GET.get(param, '') for param in PAGE_PARAMS),
+    ]
+
+
+def etag(request, *feeds, per_user=True):
+    """ETag страницы из версий лент, пользователя и параметров запроса.
+
+    Считается без запросов к лентам: страница с тем же ETag отдаётся
+    ответом 304 Not Modified без выборки постов и шаблонов. Для
+    ответов, одинаковых для всех (per_user=False), сессия не читается.
+    """
+    parts = [get_version(*feed) for feed in feeds]
+    parts += [
+        request.user.pk if per_user else None, request.GET.urlencode()
+    ]
+    return hashlib.md5(
+        '|'.join(map(str, parts)).encode()
+    ).hexdigest()
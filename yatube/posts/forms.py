@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from posts import images, thumbnails
 from posts.models import Comment, Post
 
 
@@ -12,6 +14,31 @@ class PostForm(forms.ModelForm):
             'group': 'Группа в которой будет находится пост',
         }
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            image, self.image_width, self.image_height = images.ingest(image)
+        return image
+
+    def save(self, commit=True):
+        post = super().save(commit=False)
+        image_changed = 'image' in self.changed_data
+        if image_changed:
+            post.thumbnails = ''
+            if post.image:
+                post.image_width = self.image_width
+                post.image_height = self.image_height
+                post.image_bytes = post.image.size
+            else:
+                post.image_width = post.image_height = None
+                post.image_bytes = None
+        if commit:
+            post.save()
+            self._save_m2m()
+        if image_changed and post.image:
+            thumbnails.schedule(post)
+        return post
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
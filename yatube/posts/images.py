@@ -0,0 +1,61 @@
+"""Приём загруженных картинок постов.
+
+Картинка поворачивается по EXIF, теряет метаданные, уменьшается до
+IMAGE_MAX_SIZE по большей стороне и перекодируется в IMAGE_FORMAT
+(WebP, а без его поддержки в Pillow -- оптимизированный JPEG). Всё
+дальнейшее -- миниатюры, отдача -- работает уже с небольшим файлом.
+Анимированные картинки сохраняются как есть.
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def output_format():
+    if settings.IMAGE_FORMAT == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return settings.IMAGE_FORMAT
+
+
+def ingest(upload):
+    """Нормализует загрузку; возвращает (файл, ширина, высота)."""
+    upload.seek(0)
+    with Image.open(upload) as source:
+        if getattr(source, 'is_animated', False):
+            upload.seek(0)
+            return upload, source.width, source.height
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail(
+            (settings.IMAGE_MAX_SIZE, settings.IMAGE_MAX_SIZE),
+            Image.LANCZOS,
+        )
+        image = _convert(image, output_format())
+        buffer = BytesIO()
+        options = {'quality': settings.IMAGE_QUALITY}
+        if output_format() == 'JPEG':
+            options.update(optimize=True, progressive=True)
+        else:
+            options.update(method=6)
+        image.save(buffer, output_format(), **options)
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    extension = EXTENSIONS[output_format()]
+    return (
+        ContentFile(buffer.getvalue(), name=f'{name}.{extension}'),
+        image.width,
+        image.height,
+    )
+
+
+def _convert(image, image_format):
+    transparent = (
+        image.mode in ('RGBA', 'LA', 'PA')
+        or 'transparency' in image.info
+    )
+    if transparent and image_format != 'JPEG':
+        return image if image.mode == 'RGBA' else image.convert('RGBA')
+    return image if image.mode == 'RGB' else image.convert('RGB')
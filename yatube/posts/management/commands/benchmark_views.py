@@ -0,0 +1,109 @@
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+
+from posts import benchmark
+from posts.models import User
+
+COLUMNS = ('p50', 'p95', 'p99', 'queries', 'bytes')
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет представления posts на засеянной тестовой базе и '
+        'сравнивает результат с базовой линией.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenarios',
+            nargs='+',
+            choices=benchmark.SCENARIOS,
+            default=list(benchmark.SCENARIOS),
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=50,
+            help='Сколько запросов на сценарий.',
+        )
+        parser.add_argument(
+            '--baseline',
+            default=settings.BENCHMARK_BASELINE,
+            help='Файл базовой линии (JSON).',
+        )
+        parser.add_argument(
+            '--save-baseline',
+            action='store_true',
+            help='Записать результат как новую базовую линию.',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.25,
+            help='Допустимый рост p95 относительно базовой линии.',
+        )
+        parser.add_argument(
+            '--modes',
+            nargs='+',
+            choices=benchmark.MODES,
+            default=list(benchmark.MODES),
+            help='warm -- с кешами, cold -- без кеша страниц и версий.',
+        )
+        for option, default in (
+            ('users', 1000), ('groups', 20), ('posts', 10000),
+            ('comments', 10000), ('follows', 10), ('seed', 0),
+        ):
+            parser.add_argument(f'--{option}', type=int, default=default)
+
+    def handle(self, *args, **options):
+        if options['requests'] < 2:
+            raise CommandError('Для перцентилей нужно --requests от 2')
+        runner = DiscoverRunner(verbosity=0)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            if not User.objects.exists():
+                call_command(
+                    'seed_yatube',
+                    *(f'--{option}={options[option]}' for option in (
+                        'users', 'groups', 'posts', 'comments', 'follows',
+                        'seed',
+                    )),
+                    stdout=self.stdout,
+                )
+            cache.clear()
+            results = benchmark.run(
+                options['requests'], options['scenarios'], options['modes']
+            )
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+        self.stdout.write(
+            f'{"":20}' + ''.join(f'{column:>10}' for column in COLUMNS)
+        )
+        for name, result in results.items():
+            self.stdout.write(f'{name:20}' + ''.join(
+                f'{result[column]:>10}' for column in COLUMNS
+            ))
+        if options['save_baseline']:
+            benchmark.save_baseline(options['baseline'], results)
+            self.stdout.write(self.style.SUCCESS(
+                f'Базовая линия записана в {options["baseline"]}'
+            ))
+            return
+        if not os.path.exists(options['baseline']):
+            self.stdout.write(f'Нет базовой линии {options["baseline"]}')
+            return
+        problems = benchmark.regressions(
+            results,
+            benchmark.load_baseline(options['baseline']),
+            options['threshold'],
+        )
+        if problems:
+            raise CommandError('Регрессии:\n' + '\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
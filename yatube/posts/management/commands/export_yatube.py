@@ -0,0 +1,82 @@
+import datetime
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from posts import exchange
+
+
+def iso_datetime(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает группы, посты, комментарии и подписки в JSONL или CSV, '
+        'читая базу порциями.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--models',
+            nargs='+',
+            choices=list(exchange.MODELS),
+            default=list(exchange.MODELS),
+            help='Что выгрузить (по умолчанию -- всё).',
+        )
+        parser.add_argument(
+            '--output',
+            default='.',
+            help='Каталог для файлов <модель>.jsonl / <модель>.csv.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=exchange.FORMATS,
+            default='jsonl',
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Сжимать файлы gzip.',
+        )
+        parser.add_argument(
+            '--since',
+            type=iso_datetime,
+            help='Только посты и комментарии с этой даты (ISO 8601).',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Сколько строк читать из базы за раз.',
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(options['output']):
+            raise CommandError(f'Нет каталога {options["output"]}')
+        for name in options['models']:
+            path = os.path.join(
+                options['output'],
+                exchange.file_name(name, options['format'], options['gzip']),
+            )
+            written = exchange.write(
+                path,
+                name,
+                options['format'],
+                exchange.rows(
+                    name, options['since'], options['chunk_size']
+                ),
+                options['gzip'],
+            )
+            self.stdout.write(f'{path}: {written}')
+        self.stdout.write(self.style.SUCCESS('Выгрузка завершена'))
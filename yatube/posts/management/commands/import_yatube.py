@@ -0,0 +1,100 @@
+import itertools
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts import exchange, feed_cache, stats
+from posts.paginators import invalidate_counts
+
+STATS_CHUNK = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает группы, посты, комментарии и подписки из JSONL '
+        'пачками через bulk_create.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'files',
+            nargs='+',
+            help='Файлы <модель>.jsonl[.gz], например из export_yatube.',
+        )
+        parser.add_argument(
+            '--model',
+            choices=list(exchange.MODELS),
+            help='Модель всех файлов, если её не видно из имени.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Сколько строк читать и вставлять за раз.',
+        )
+        parser.add_argument(
+            '--rebuild-timelines',
+            action='store_true',
+            help='Пересобрать ленты подписок после загрузки.',
+        )
+
+    def handle(self, *args, **options):
+        files = []
+        for path in options['files']:
+            name = options['model'] or exchange.model_name(path)
+            if name is None:
+                raise CommandError(
+                    f'Не понять, что в {path}: укажите --model'
+                )
+            files.append((path, name))
+        # Группы и посты раньше комментариев и подписок, которые на них
+        # ссылаются.
+        order = list(exchange.MODELS)
+        files.sort(key=lambda item: order.index(item[1]))
+        total = 0
+        started = time.perf_counter()
+        # Одна транзакция: упавшая загрузка не оставляет половины файлов.
+        with exchange.load_pragmas(), transaction.atomic():
+            resolver = exchange.Resolver()
+            touched = set()
+            for path, name in files:
+                total += self.load(path, name, resolver, touched, options)
+            exchange.reset_sequences()
+            # bulk_create не шлёт сигналов: счётчики пользователей
+            # обновляются здесь, один раз на всю загрузку.
+            touched = list(touched)
+            for start in range(0, len(touched), STATS_CHUNK):
+                stats.recompute(touched[start:start + STATS_CHUNK])
+        feed_cache.bump(feed_cache.ALL_FEEDS)
+        invalidate_counts(
+            ('index',),
+            *(('group', pk) for pk in resolver.groups.values()),
+            *(('profile', pk) for pk in touched),
+        )
+        if options['rebuild_timelines']:
+            call_command('rebuild_timelines', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено строк: {total}, {self.rate(total, started)} строк/с'
+        ))
+
+    def load(self, path, name, resolver, touched, options):
+        """Загружает файл пачками; возвращает число строк."""
+        started = time.perf_counter()
+        records = exchange.read_jsonl(path)
+        loaded = 0
+        while True:
+            batch = list(itertools.islice(records, options['batch_size']))
+            if not batch:
+                break
+            touched.update(exchange.load(name, batch, resolver))
+            loaded += len(batch)
+        self.stdout.write(
+            f'{path}: {loaded} строк, {self.rate(loaded, started)} строк/с'
+        )
+        return loaded
+
+    @staticmethod
+    def rate(rows, started):
+        return round(rows / max(time.perf_counter() - started, 1e-6))
@@ -0,0 +1,134 @@
+import re
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.slow_queries import explain, scanned_table
+from posts import benchmark
+
+# Строки плана SQLite: сортировка во временном B-дереве после фильтра
+# и индекс, по которому идёт поиск.
+SORT_RE = re.compile(r'USE TEMP B-TREE FOR .*ORDER BY')
+INDEX_RE = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+
+
+class Collector:
+    """execute_wrapper: первые параметры каждого SELECT и его сценарий."""
+
+    def __init__(self):
+        self.scenario = None
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.statements.setdefault(sql, (self.scenario, params))
+        return execute(sql, params, many, context)
+
+
+def collect(names, requests):
+    """SELECT-ы сценариев names; все изменения откатываются."""
+    collector = Collector()
+    with benchmark.cold(), transaction.atomic():
+        plans = benchmark.scenarios()
+        with connection.execute_wrapper(collector):
+            for name in names:
+                collector.scenario = name
+                client, method, url, data = plans[name]
+                for _ in range(requests):
+                    getattr(client, method)(url, data)
+        transaction.set_rollback(True)
+    return collector.statements
+
+
+def problems(plan):
+    for line in plan:
+        table = scanned_table(line)
+        if table:
+            yield f'полный просмотр {table}'
+        elif SORT_RE.search(line):
+            yield 'сортировка после фильтра'
+
+
+def indexes():
+    """Неуникальные индексы таблиц posts: имя -> (таблица, колонки)."""
+    found = {}
+    with connection.cursor() as cursor:
+        for model in apps.get_app_config('posts').get_models():
+            table = model._meta.db_table
+            constraints = connection.introspection.get_constraints(
+                cursor, table
+            )
+            for name, info in constraints.items():
+                if info['index'] and not info['unique']:
+                    found[name] = (table, info['columns'])
+    return found
+
+
+def covering(name, found):
+    """Индекс той же таблицы, колонки name -- его начало."""
+    table, columns = found[name]
+    for other, (other_table, other_columns) in found.items():
+        if (
+            other != name and other_table == table
+            and len(other_columns) > len(columns)
+            and other_columns[:len(columns)] == columns
+        ):
+            return other
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет запросы представлений posts через EXPLAIN и сообщает, '
+        'каких индексов не хватает и какие не используются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenarios',
+            nargs='+',
+            choices=benchmark.SCENARIOS,
+            default=list(benchmark.SCENARIOS),
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=1,
+            help='Сколько запросов на сценарий.',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Планы разбираются только для SQLite')
+        try:
+            statements = collect(options['scenarios'], options['requests'])
+        except ValueError as error:
+            raise CommandError(error)
+        used = set()
+        missing = []
+        for sql, (scenario, params) in statements.items():
+            plan = explain(connection, sql, params) or ()
+            used.update(
+                match.group(1) for match in map(INDEX_RE.search, plan)
+                if match
+            )
+            missing.extend(
+                (scenario, problem, sql) for problem in problems(plan)
+            )
+        self.stdout.write(f'Запросов разобрано: {len(statements)}')
+        self.stdout.write('Не хватает индексов:' if missing else
+                          'Все запросы идут по индексам')
+        for scenario, problem, sql in missing:
+            self.stdout.write(f'  {scenario}: {problem}\n    {sql}')
+        found = indexes()
+        unused = sorted(set(found) - used)
+        if unused:
+            self.stdout.write('Не использованы в сценариях:')
+        for name in unused:
+            table, columns = found[name]
+            line = f'  {table}.{name} ({", ".join(columns)})'
+            wider = covering(name, found)
+            if wider is not None:
+                line += f' -- покрыт {wider}'
+            self.stdout.write(line)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from posts import stats
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики пользователей (UserStats) по базе.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Сколько пользователей пересчитывать за один проход.',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+        chunk = []
+        repaired = 0
+        for user_id in user_ids.iterator(chunk_size=chunk_size):
+            chunk.append(user_id)
+            if len(chunk) == chunk_size:
+                stats.recompute(chunk)
+                repaired += len(chunk)
+                chunk = []
+        if chunk:
+            stats.recompute(chunk)
+            repaired += len(chunk)
+        self.stdout.write(
+            self.style.SUCCESS(f'Пересчитано пользователей: {repaired}')
+        )
@@ -0,0 +1,232 @@
+import datetime
+import itertools
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts import exchange, feed_cache, stats
+from posts.models import Comment, Follow, Group, Post, User
+from posts.paginators import invalidate_counts
+
+SYLLABLES = (
+    'ба', 'ве', 'го', 'да', 'ли', 'ко', 'ра', 'ст', 'но', 'ми', 'ту', 'пе',
+    'зо', 'че', 'шу', 'ны', 'ор', 'ан', 'ел', 'ус', 'ка', 'ро', 'ти', 'ма',
+)
+VOCABULARY_SIZE = 5000
+# Все даты отсчитываются от постоянной точки: один и тот же seed даёт
+# одни и те же данные, когда бы команда ни запускалась.
+UNTIL = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+STATS_CHUNK = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами, '
+        'комментариями и подписками со степенным распределением.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument(
+            '--follows',
+            type=float,
+            default=20,
+            help='Среднее число подписок на пользователя.',
+        )
+        parser.add_argument(
+            '--zipf',
+            type=float,
+            default=1.1,
+            help='Показатель степенного закона популярности авторов.',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='За сколько дней до 2025-01-01 разбросаны посты.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--no-rebuild-timelines',
+            dest='rebuild_timelines',
+            action='store_false',
+            help='Не пересобирать ленты подписок: без пересборки они пусты.',
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.vocabulary = [
+            ''.join(self.rng.choices(SYLLABLES, k=self.rng.randint(1, 4)))
+            for _ in range(VOCABULARY_SIZE)
+        ]
+        self.since = UNTIL - datetime.timedelta(days=options['days'])
+        prefix = f's{options["seed"]}'
+        # Имена и slug берутся из seed: повторный запуск с тем же seed
+        # упал бы на уникальности посреди записи.
+        if (
+            User.objects.filter(username__startswith=f'{prefix}-').exists()
+            or Group.objects.filter(slug__startswith=f'{prefix}-').exists()
+        ):
+            raise CommandError(
+                f'В базе уже есть данные seed {options["seed"]}: '
+                f'укажите другой --seed'
+            )
+        with exchange.load_pragmas():
+            user_ids = self.create(
+                'пользователей',
+                User,
+                options['users'],
+                self.user_factory(prefix),
+            )
+            group_ids = self.create(
+                'групп',
+                Group,
+                options['groups'],
+                lambda i: Group(
+                    title=f'Группа {self.sentence(1, 3)}',
+                    slug=f'{prefix}-group-{i}',
+                    description=self.sentence(5, 30),
+                ),
+            )
+            # Популярность авторов: i-й пользователь весит 1 / (i+1)**s.
+            popular = list(itertools.accumulate(
+                1 / (rank + 1) ** options['zipf']
+                for rank in range(len(user_ids))
+            ))
+            post_ids = self.create(
+                'постов',
+                Post,
+                options['posts'],
+                lambda i: Post(
+                    author_id=self.pick(user_ids, popular),
+                    group_id=(
+                        self.rng.choice(group_ids)
+                        if group_ids and self.rng.random() < 0.5 else None
+                    ),
+                    text=self.sentence(3, 80),
+                    pub_date=self.moment(),
+                ),
+                date_field='pub_date',
+            )
+            if post_ids:
+                self.create(
+                    'комментариев',
+                    Comment,
+                    options['comments'],
+                    lambda i: Comment(
+                        post_id=self.rng.choice(post_ids),
+                        author_id=self.rng.choice(user_ids),
+                        text=self.sentence(1, 30),
+                        created=self.moment(),
+                    ),
+                    date_field='created',
+                    return_ids=False,
+                )
+            self.follow_graph(user_ids, popular, options['follows'])
+        for start in range(0, len(user_ids), STATS_CHUNK):
+            stats.recompute(user_ids[start:start + STATS_CHUNK])
+        feed_cache.bump(feed_cache.ALL_FEEDS)
+        invalidate_counts(
+            ('index',),
+            *(('group', pk) for pk in group_ids),
+            *(('profile', pk) for pk in user_ids),
+        )
+        if options['rebuild_timelines']:
+            call_command('rebuild_timelines', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS('База заполнена'))
+
+    def user_factory(self, prefix):
+        password = make_password(None)
+        return lambda i: User(
+            username=f'{prefix}-user-{i}',
+            first_name=self.rng.choice(self.vocabulary).capitalize(),
+            password=password,
+        )
+
+    def sentence(self, shortest, longest):
+        return ' '.join(self.rng.choices(
+            self.vocabulary, k=self.rng.randint(shortest, longest)
+        ))
+
+    def moment(self):
+        return self.since + datetime.timedelta(
+            seconds=self.rng.random() * (UNTIL - self.since).total_seconds()
+        )
+
+    def pick(self, ids, cum_weights):
+        return self.rng.choices(ids, cum_weights=cum_weights)[0]
+
+    def create(self, label, model, count, factory, date_field=None,
+               return_ids=True):
+        """Создаёт count объектов пачками; возвращает их id.
+
+        Объекты с датой в date_field вставляются exchange.insert, мимо
+        auto_now_add, поэтому id им выдаются здесь.
+        """
+        started = time.perf_counter()
+        last_id = model.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        for start in range(0, count, self.batch_size):
+            objects = []
+            for i in range(start, min(start + self.batch_size, count)):
+                obj = factory(i)
+                if date_field is not None:
+                    obj.pk = last_id + 1 + i
+                objects.append(obj)
+            with transaction.atomic():
+                if date_field is None:
+                    model.objects.bulk_create(objects)
+                else:
+                    exchange.insert(model, objects)
+        if date_field is not None:
+            exchange.reset_sequences()
+        self.report(label, count, started)
+        if not return_ids:
+            return None
+        return list(model.objects.filter(pk__gt=last_id).order_by(
+            'pk').values_list('pk', flat=True))
+
+    def follow_graph(self, user_ids, popular, mean):
+        """Подписки: число подписок и популярность авторов -- по Парето."""
+        started = time.perf_counter()
+        created = 0
+        batch = []
+        # Среднее распределения Парето с alpha=2 равно 2.
+        for user_id in user_ids:
+            count = min(
+                int(mean / 2 * self.rng.paretovariate(2)), len(user_ids) - 1
+            )
+            authors = set(self.rng.choices(
+                user_ids, cum_weights=popular, k=count
+            )) - {user_id}
+            batch.extend(
+                Follow(user_id=user_id, author_id=author_id)
+                for author_id in sorted(authors)
+            )
+            if len(batch) >= self.batch_size:
+                created += self.save_follows(batch)
+                batch = []
+        if batch:
+            created += self.save_follows(batch)
+        self.report('подписок', created, started)
+
+    @staticmethod
+    def save_follows(batch):
+        with transaction.atomic():
+            Follow.objects.bulk_create(batch, ignore_conflicts=True)
+        return len(batch)
+
+    def report(self, label, count, started):
+        elapsed = max(time.perf_counter() - started, 1e-6)
+        self.stdout.write(
+            f'Создано {label}: {count}, {round(count / elapsed)} в секунду'
+        )
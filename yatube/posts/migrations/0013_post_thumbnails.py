@@ -0,0 +1,22 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:51
+
+from django.db import migrations, models
+
+from posts.search import RESTORE_TRIGGERS
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_fts'),
+    ]
+
+    operations = [
+        migrations.RunSQL(migrations.RunSQL.noop, RESTORE_TRIGGERS),
+        migrations.AddField(
+            model_name='post',
+            name='thumbnails',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Адреса готовых миниатюр картинки (JSON)', verbose_name='Миниатюры'),
+        ),
+        migrations.RunSQL(RESTORE_TRIGGERS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:57
+
+import core.storage
+from django.db import migrations, models
+
+from posts.search import RESTORE_TRIGGERS
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_image_dimensions'),
+    ]
+
+    operations = [
+        migrations.RunSQL(migrations.RunSQL.noop, RESTORE_TRIGGERS),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Загрузите подходящую картинку', storage=core.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunSQL(RESTORE_TRIGGERS, migrations.RunSQL.noop),
+    ]
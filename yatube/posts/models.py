@@ -1,6 +1,10 @@
+import json
+
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from core.storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -38,7 +42,33 @@ class Post(models.Model):
         'Картинка',
         help_text='Загрузите подходящую картинку',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
+        blank=True,
+    )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    image_bytes = models.PositiveIntegerField(
+        'Размер картинки, байт',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    thumbnails = models.TextField(
+        'Миниатюры',
+        help_text='Адреса готовых миниатюр картинки (JSON)',
         blank=True,
+        default='',
+        editable=False,
     )
     group = models.ForeignKey(
         'Group',
@@ -52,12 +82,31 @@ class Post(models.Model):
 
     class Meta:
         ordering = ['-pub_date']
+        # По возрастанию: SQLite читает индекс с конца и так получает
+        # ORDER BY pub_date DESC, id DESC без сортировки, ведь id входит
+        # в индекс неявно и тоже по возрастанию.
+        indexes = [
+            models.Index(
+                fields=['author', 'pub_date'],
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['group', 'pub_date'],
+                name='post_group_pub_date_idx',
+            ),
+        ]
         verbose_name = 'Пост',
         verbose_name_plural = 'Посты'
 
     def __str__(self) -> str:
         return self.text[:15]
 
+    def thumbnail_url(self, name):
+        """Адрес готовой миниатюры, пока её нет -- адрес оригинала."""
+        if not self.image:
+            return ''
+        return json.loads(self.thumbnails or '{}').get(name, self.image.url)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -85,6 +134,12 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx',
+            ),
+        ]
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
@@ -124,3 +179,66 @@ class Follow(models.Model):
 
     def __str__(self) -> str:
         return f'{self.user.username} подписан на {self.author.username}'
+
+
+class Timeline(models.Model):
+    """Материализованная лента подписок: пост у каждого подписчика."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date', '-post']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_user_post',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_feed_idx',
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+
+    def __str__(self) -> str:
+        return f'{self.post_id} в ленте {self.user_id}'
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, которые иначе пришлось бы считать COUNT(*)."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    post_count = models.PositiveIntegerField('Постов', default=0)
+    follower_count = models.PositiveIntegerField(
+        'Подписчиков',
+        default=0,
+        db_index=True,
+    )
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+    comment_count = models.PositiveIntegerField('Комментариев', default=0)
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+    def __str__(self) -> str:
+        return f'Статистика {self.user_id}'
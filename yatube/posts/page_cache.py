@@ -0,0 +1,181 @@
+"""Кеш целых страниц, общий для всех посетителей.
+
+Представление помечает ответ лентами, из которых он собран:
+surrogate(request, ('group', 1)). Страница хранится вместе с версиями
+этих лент (см. feed_cache) и отдаётся, пока ни одна из них не
+поднялась; сигналы, которые поднимают версии при изменении постов,
+комментариев, подписок и групп, тем самым сбрасывают ровно те
+страницы, которые от них зависят.
+
+Части страницы, которые зависят от пользователя (шапка, кнопка
+подписки, форма комментария), шаблон отмечает тегом
+{% hole 'header' view_name=... %}. В кеш страница попадает с метками
+вместо них, а метки заменяются фрагментами текущего пользователя
+уже после кеша -- одна запись служит и анонимам, и вошедшим.
+"""
+import hashlib
+import re
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, quote_etag
+
+from posts import feed_cache
+from posts.forms import CommentForm
+from posts.models import Follow
+
+HOLE_RE = re.compile(rb'<!--hole:([\w:.-]+)-->')
+HOLE_SALT = 'posts.page_cache.hole'
+
+
+def surrogate(request, *feeds):
+    """Разрешает кешировать ответ и помечает его лентами feeds."""
+    request.surrogate_feeds = feeds
+
+
+def page_key(request):
+    """Ключ страницы или None, если её нельзя брать из кеша.
+
+    В ключ входят путь и только параметры из PAGE_CACHE_PARAMS: иначе
+    каждый выдуманный ?x=1 заводил бы свою запись и вытеснял настоящие
+    страницы. Запросы с другими параметрами идут мимо кеша.
+    """
+    params = request.GET
+    if any(
+        name not in settings.PAGE_CACHE_PARAMS or len(params.getlist(name)) > 1
+        for name in params
+    ):
+        return None
+    query = urlencode(sorted(params.items()))
+    path = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+    return f'page:{path}'
+
+
+def versions(feeds):
+    return [feed_cache.get_version(*feed) for feed in feeds]
+
+
+def follow_context(request, author):
+    user = request.user
+    return {
+        'following': (
+            user.is_authenticated
+            and user.username != author
+            and Follow.objects.filter(
+                user=user, author__username=author).exists()
+        ),
+    }
+
+
+def comment_context(request, post):
+    return {'form': CommentForm()}
+
+
+# Имя дыры -> (шаблон, функция дополнительного контекста).
+HOLES = {
+    'header': ('includes/header.html', None),
+    'switcher': ('posts/includes/switcher.html', None),
+    'follow_button': ('posts/includes/follow_button.html', follow_context),
+    'edit_button': ('posts/includes/edit_button.html', None),
+    'comment_form': ('posts/includes/comment_form.html', comment_context),
+}
+
+
+def hole(request, name, args):
+    """Метка дыры, если страница идёт в кеш, иначе сам фрагмент.
+
+    Аргументы дыры сохраняются в метке, поэтому должны быть простыми
+    значениями (строки, числа): контекста страницы при заполнении уже
+    нет.
+    """
+    if getattr(request, 'punch_holes', False):
+        token = signing.dumps([name, args], salt=HOLE_SALT)
+        return f'<!--hole:{token}-->'
+    return render_hole(request, name, args)
+
+
+def render_hole(request, name, args):
+    template_name, get_context = HOLES[name]
+    context = dict(args)
+    if get_context is not None and request is not None:
+        context.update(get_context(request, **args))
+    return render_to_string(template_name, context, request)
+
+
+def fill(request, content):
+    """Заменяет метки дыр фрагментами для request.user."""
+    def replace(match):
+        try:
+            name, args = signing.loads(
+                match.group(1).decode(), salt=HOLE_SALT
+            )
+        except signing.BadSignature:
+            return b''
+        return render_hole(request, name, args).encode()
+    return HOLE_RE.sub(replace, content)
+
+
+class PageCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+        key = page_key(request)
+        if key is None:
+            return self.get_response(request)
+        entry = cache.get(key)
+        if entry is not None and entry['versions'] == versions(
+            entry['feeds']
+        ):
+            return self.from_entry(request, entry)
+        request.punch_holes = True
+        response = self.get_response(request)
+        if response.streaming or not response.get(
+            'Content-Type', ''
+        ).startswith('text/html'):
+            return response
+        feeds = getattr(request, 'surrogate_feeds', None)
+        if feeds and self.is_cacheable(response):
+            cache.set(key, {
+                'feeds': feeds,
+                'versions': versions(feeds),
+                'status': response.status_code,
+                # ETag включает пользователя и считается заново.
+                'etag': response.has_header('ETag'),
+                'headers': [
+                    (header, value) for header, value in response.items()
+                    if header != 'ETag'
+                ],
+                'content': response.content,
+            }, settings.PAGE_CACHE_TIMEOUT)
+        response.content = fill(request, response.content)
+        return response
+
+    @staticmethod
+    def is_cacheable(response):
+        return response.status_code == 200 and not response.cookies
+
+    @staticmethod
+    def from_entry(request, entry):
+        # Представление не вызывается, поэтому CSRF-куку для формы
+        # комментария нужно прочитать здесь, а не выпускать новую.
+        CsrfViewMiddleware().process_view(request, None, (), {})
+        response = HttpResponse(
+            fill(request, entry['content']), status=entry['status']
+        )
+        for header, value in entry['headers']:
+            response[header] = value
+        etag = None
+        if entry['etag']:
+            etag = response['ETag'] = quote_etag(
+                feed_cache.etag(request, *entry['feeds']))
+        return get_conditional_response(
+            request, etag=etag, response=response
+        )
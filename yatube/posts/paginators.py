@@ -0,0 +1,324 @@
+import base64
+import binascii
+import heapq
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Page, Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+FEED_ORDERING = ('-pub_date', '-pk')
+ELLIPSIS = '…'
+
+
+def count_cache_key(*parts):
+    return ':'.join(['paginator-count', *map(str, parts)])
+
+
+def invalidate_counts(*keys):
+    cache.delete_many([count_cache_key(*key) for key in keys])
+
+
+def cached_count(key, queryset):
+    """COUNT(*) из кеша; устаревшее значение обновляется в фоне.
+
+    Пока идёт пересчёт, читатели получают прежнее (приблизительное)
+    значение, а не ждут COUNT по всей таблице.
+    """
+    cache_key = count_cache_key(*key)
+    cached = cache.get(cache_key)
+    if cached is None:
+        return _store_count(cache_key, queryset)
+    value, refresh_at = cached
+    if refresh_at <= time.time() and cache.add(
+        f'{cache_key}:refreshing', True, settings.PAGINATOR_COUNT_REFRESH
+    ):
+        if settings.PAGINATOR_COUNT_ASYNC:
+            threading.Thread(
+                target=_refresh_count,
+                args=(cache_key, queryset),
+                daemon=True,
+            ).start()
+        else:
+            value = _store_count(cache_key, queryset)
+    return value
+
+
+def _store_count(cache_key, queryset):
+    value = queryset.count()
+    cache.set(
+        cache_key,
+        (value, time.time() + settings.PAGINATOR_COUNT_REFRESH),
+        settings.PAGINATOR_COUNT_TIMEOUT,
+    )
+    return value
+
+
+def _refresh_count(cache_key, queryset):
+    try:
+        _store_count(cache_key, queryset)
+    finally:
+        cache.delete(f'{cache_key}:refreshing')
+        connection.close()
+
+
+def encode_cursor(values):
+    """Упаковывает значения ключа сортировки в непрозрачный токен."""
+    raw = json.dumps(
+        [value.isoformat() if hasattr(value, 'isoformat') else value
+         for value in values],
+        separators=(',', ':'),
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора, None для битого токена."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+class CursorPage(Page):
+    """Страница, открытая по курсору: номера у неё нет."""
+
+    def __init__(self, object_list, paginator, has_previous, has_next):
+        super().__init__(object_list, None, paginator)
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __repr__(self):
+        return '<Page after cursor>'
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def start_index(self):
+        return None
+
+    def end_index(self):
+        return None
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу (keyset) вместо OFFSET.
+
+    Страницы с номером (?page=N) работают как в обычном Paginator,
+    страницы с курсором (?after=/?before=) выбираются условием по ключу
+    сортировки, без OFFSET и COUNT, и не зависят от глубины листания.
+    С count_key число записей берётся из кеша (см. cached_count).
+    """
+
+    # Открываются ли страницы по номеру (?page=N).
+    numbered = True
+
+    def __init__(self, object_list, per_page, ordering=FEED_ORDERING,
+                 count_key=None, **kwargs):
+        super().__init__(object_list.order_by(*ordering), per_page, **kwargs)
+        self.ordering = ordering
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return self.object_list.count()
+        return cached_count(self.count_key, self.object_list)
+
+    def get_elided_page_range(self, number=1, on_each_side=2, on_ends=1):
+        """Номера страниц вокруг текущей, пропуски отмечены ELLIPSIS."""
+        number = self.validate_number(number)
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > on_each_side + on_ends + 2:
+            yield from range(1, on_ends + 1)
+            yield ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < self.num_pages - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield ELLIPSIS
+            yield from range(self.num_pages - on_ends + 1,
+                             self.num_pages + 1)
+        else:
+            yield from range(number + 1, self.num_pages + 1)
+
+    def get_page(self, number, after=None, before=None):
+        values = decode_cursor(after or before)
+        if values is not None:
+            page = self.cursor_page(values, backwards=not after)
+            if page is not None:
+                return page
+        page = super().get_page(number)
+        page.page_window = list(self.get_elided_page_range(page.number))
+        self.set_cursors(page)
+        return page
+
+    def cursor_page(self, values, backwards=False):
+        """Страница сразу после (или перед) позицией курсора.
+
+        Без курсора (values=None) -- первая страница, тоже без COUNT.
+        """
+        rows = self.fetch(values, backwards, self.per_page + 1)
+        if rows is None:
+            return None
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+        page = CursorPage(
+            rows,
+            self,
+            has_previous=has_more if backwards else values is not None,
+            has_next=True if backwards else has_more,
+        )
+        self.set_cursors(page)
+        return page
+
+    def fetch(self, values, backwards, limit):
+        """Строки за курсором в порядке удаления от него."""
+        return keyset(self.object_list, self.ordering, values,
+                      backwards, limit)
+
+    def set_cursors(self, page):
+        page.previous_cursor = page.next_cursor = None
+        if not len(page):
+            return
+        if page.has_previous():
+            page.previous_cursor = encode_cursor(row_key(page[0],
+                                                         self.ordering))
+        if page.has_next():
+            page.next_cursor = encode_cursor(row_key(page[-1],
+                                                     self.ordering))
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """Курсорный пагинатор поверх нескольких отсортированных потоков.
+
+    streams -- кортежи (queryset, ordering, transform): каждый queryset
+    листается своим ключом, строки приводятся transform к общему виду
+    и сливаются k-way слиянием по ключу self.ordering.
+
+    У слитой ленты нет OFFSET: страница N потребовала бы N страниц из
+    каждого потока. Поэтому номер есть только у первой страницы, дальше
+    лента листается по курсору, а ?page=N открывает первую страницу.
+    С count_key число записей для первой страницы берётся из кеша.
+    """
+
+    numbered = False
+
+    def __init__(self, streams, per_page, ordering=FEED_ORDERING,
+                 **kwargs):
+        self.streams = [
+            (queryset.order_by(*stream_ordering), stream_ordering, transform)
+            for queryset, stream_ordering, transform in streams
+        ]
+        super().__init__(self.streams[0][0], per_page, ordering, **kwargs)
+
+    @cached_property
+    def count(self):
+        total = StreamsCount(queryset for queryset, _, _ in self.streams)
+        if self.count_key is None:
+            return total.count()
+        return cached_count(self.count_key, total)
+
+    def get_page(self, number, after=None, before=None):
+        values = decode_cursor(after or before)
+        if values is not None:
+            page = self.cursor_page(values, backwards=not after)
+            if page is not None:
+                return page
+        page = self._get_page(self.fetch(None, False, self.per_page), 1, self)
+        self.set_cursors(page)
+        return page
+
+    def fetch(self, values, backwards, limit):
+        sources = []
+        for queryset, ordering, transform in self.streams:
+            rows = keyset(queryset, ordering, values, backwards, limit)
+            if rows is None:
+                return None
+            if transform is not None:
+                rows = [transform(row) for row in rows]
+            sources.append(rows)
+        merged = heapq.merge(
+            *sources,
+            key=lambda row: row_key(row, self.ordering),
+            reverse=not backwards,
+        )
+        return [row for _, row in zip(range(limit), merged)]
+
+
+class StreamsCount:
+    """Сумма COUNT(*) нескольких queryset; для cached_count."""
+
+    def __init__(self, querysets):
+        self.querysets = list(querysets)
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+
+def keyset(queryset, ordering, values, backwards, limit):
+    """Не более limit строк queryset строго за ключом values.
+
+    Возвращает None, если значения курсора не подходят к ordering.
+    """
+    if values is None:
+        return list(queryset.order_by(*ordering)[:limit])
+    if len(values) != len(ordering):
+        return None
+    try:
+        values = [
+            _resolve_field(queryset.model, name.lstrip('-')).to_python(value)
+            for name, value in zip(ordering, values)
+        ]
+    except (FieldDoesNotExist, TypeError, ValidationError):
+        return None
+    if any(value is None for value in values):
+        return None
+    condition = Q()
+    for index, name in enumerate(ordering):
+        lookup = 'lt' if name.startswith('-') != backwards else 'gt'
+        step = Q(**{f'{name.lstrip("-")}__{lookup}': values[index]})
+        for prev_name, prev_value in zip(ordering[:index], values):
+            step &= Q(**{prev_name.lstrip('-'): prev_value})
+        condition |= step
+    if backwards:
+        ordering = [_reverse(name) for name in ordering]
+    return list(queryset.filter(condition).order_by(*ordering)[:limit])
+
+
+def row_key(row, ordering):
+    return tuple(getattr(row, name.lstrip('-')) for name in ordering)
+
+
+def _reverse(name):
+    return name[1:] if name.startswith('-') else f'-{name}'
+
+
+def _resolve_field(model, name):
+    if name == 'pk':
+        return model._meta.pk
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        for field in model._meta.concrete_fields:
+            if field.attname == name:
+                return field
+        raise
@@ -0,0 +1,84 @@
+"""Полнотекстовый поиск по постам на индексе SQLite FTS5.
+
+Таблица posts_post_fts хранит только индекс по Post.text (external
+content) и обновляется триггерами на posts_post. Миграции, которые
+перестраивают posts_post, создают триггеры заново (RESTORE_TRIGGERS).
+"""
+import re
+
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+from posts.models import Post
+
+FTS_TABLE = 'posts_post_fts'
+TRIGGERS = {
+    'posts_post_fts_insert': (
+        'AFTER INSERT ON posts_post BEGIN '
+        'INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text); '
+        'END'
+    ),
+    'posts_post_fts_delete': (
+        'AFTER DELETE ON posts_post BEGIN '
+        'INSERT INTO posts_post_fts(posts_post_fts, rowid, text) '
+        "VALUES ('delete', old.id, old.text); "
+        'END'
+    ),
+    'posts_post_fts_update': (
+        'AFTER UPDATE OF text ON posts_post BEGIN '
+        'INSERT INTO posts_post_fts(posts_post_fts, rowid, text) '
+        "VALUES ('delete', old.id, old.text); "
+        'INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text); '
+        'END'
+    ),
+}
+# Для миграций, которые меняют posts_post: SQLite перестраивает таблицу
+# через копию, и триггеры удаляются вместе со старой таблицей.
+RESTORE_TRIGGERS = [
+    f'CREATE TRIGGER IF NOT EXISTS {name} {body}'
+    for name, body in TRIGGERS.items()
+]
+TERM_RE = re.compile(r'\w+')
+
+
+def match_expression(query):
+    """Запрос пользователя в безопасное выражение MATCH.
+
+    Слова ищутся по префиксу и все сразу; синтаксис FTS5 (кавычки,
+    NEAR, OR, ...) из пользовательского ввода не пропускается.
+    """
+    return ' '.join(f'"{term}"*' for term in TERM_RE.findall(query))
+
+
+def matching_ids(query):
+    """Подзапрос с id подходящих постов, для filter(pk__in=...)."""
+    return RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (match_expression(query),),
+    )
+
+
+def search_posts(query, queryset=None):
+    """Посты по запросу, самые релевантные (bm25) первыми."""
+    if queryset is None:
+        queryset = Post.objects.all()
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[
+            f'{FTS_TABLE}.rowid = {Post._meta.db_table}.id',
+            f'{FTS_TABLE} MATCH %s',
+        ],
+        params=[expression],
+        order_by=[f'{FTS_TABLE}.rank', '-pub_date'],
+    )
+
+
+def rebuild(using='default'):
+    """Перестраивает индекс целиком по содержимому posts_post."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
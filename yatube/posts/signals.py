@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core import jobs, storage
+from posts import feed_cache, stats, thumbnails, timeline
+from posts.models import Comment, Follow, Group, Post, User, UserStats
+from posts.paginators import invalidate_counts
+
+
+@receiver(post_save, sender=Post)
+def push_post_to_timelines(sender, instance, created, **kwargs):
+    if created:
+        jobs.enqueue(timeline.deliver, instance.pk)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_post(sender, instance, **kwargs):
+    instance._previous_group_id = None
+    instance._previous_image = ''
+    if instance.pk is not None:
+        previous = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', 'image').first()
+        if previous is not None:
+            instance._previous_group_id, instance._previous_image = previous
+
+
+@receiver(post_save, sender=Post)
+def count_image_refs(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_image', '')
+    if instance.image.name != previous:
+        storage.retain(instance.image.name)
+        release_image(previous)
+
+
+@receiver(post_delete, sender=Post)
+def release_post_image(sender, instance, **kwargs):
+    release_image(instance.image.name)
+
+
+def release_image(name):
+    # Файл удаляется только после фиксации: при откате ссылка на него
+    # останется в базе.
+    if storage.release(name):
+        transaction.on_commit(
+            lambda: jobs.enqueue(thumbnails.delete_image, name)
+        )
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_feeds(sender, instance, **kwargs):
+    feeds = feed_cache.post_feeds(
+        instance, getattr(instance, '_previous_group_id', None)
+    )
+    invalidate_counts(*feeds)
+    feed_cache.bump(*feeds)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_feeds(sender, instance, **kwargs):
+    if Comment.post.is_cached(instance):
+        post = instance.post
+    else:
+        post = Post.objects.filter(pk=instance.post_id).only(
+            'author_id', 'group_id'
+        ).first()
+    if post is not None:
+        feed_cache.bump(*feed_cache.post_feeds(post))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_all_feeds(sender, instance, **kwargs):
+    feed_cache.bump(feed_cache.ALL_FEEDS)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        jobs.enqueue(timeline.backfill, instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    timeline.remove(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def count_posts(sender, instance, created=True, **kwargs):
+    if created:
+        delta = 1 if kwargs['signal'] is post_save else -1
+        stats.change(instance.author_id, post_count=delta)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def count_comments(sender, instance, created=True, **kwargs):
+    if created:
+        delta = 1 if kwargs['signal'] is post_save else -1
+        stats.change(instance.author_id, comment_count=delta)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def count_follows(sender, instance, created=True, **kwargs):
+    if created:
+        delta = 1 if kwargs['signal'] is post_save else -1
+        stats.change(instance.author_id, follower_count=delta)
+        stats.change(instance.user_id, following_count=delta)
+        timeline.follower_count_changed(instance.author_id, delta)
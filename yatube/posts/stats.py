@@ -0,0 +1,70 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from posts import feed_cache
+from posts.models import Comment, Follow, Post, User, UserStats
+
+COUNTERS = {
+    'post_count': (Post, 'author_id'),
+    'follower_count': (Follow, 'author_id'),
+    'following_count': (Follow, 'user_id'),
+    'comment_count': (Comment, 'author_id'),
+}
+
+
+def get_stats(user):
+    """Счётчики пользователя; при первом обращении считаются по базе."""
+    try:
+        return UserStats.objects.get(user_id=user.pk)
+    except UserStats.DoesNotExist:
+        try:
+            recompute([user.pk])
+        except IntegrityError:
+            # Строку одновременно посчитал другой запрос.
+            pass
+        return UserStats.objects.get(user_id=user.pk)
+
+
+def change(user_id, **deltas):
+    """Сдвигает счётчики: change(1, post_count=1, comment_count=-1).
+
+    Строки, которых ещё нет, не создаются: их посчитает get_stats.
+    """
+    UserStats.objects.filter(user_id=user_id).update(**{
+        counter: F(counter) + delta for counter, delta in deltas.items()
+    })
+    feed_cache.bump(stats_feed(user_id))
+
+
+def stats_feed(user_id):
+    """Версия, которая поднимается при любом изменении счётчиков."""
+    return ('stats', user_id)
+
+
+def recompute(user_ids):
+    """Пересчитывает счётчики пользователей по базе одной пачкой."""
+    user_ids = list(user_ids)
+    totals = {
+        counter: dict(
+            model.objects.filter(**{f'{field}__in': user_ids}).order_by(
+            ).values(field).annotate(
+                total=Count('pk')
+            ).values_list(field, 'total')
+        )
+        for counter, (model, field) in COUNTERS.items()
+    }
+    with transaction.atomic():
+        UserStats.objects.filter(user_id__in=user_ids).delete()
+        UserStats.objects.bulk_create(
+            UserStats(
+                user_id=user_id,
+                **{
+                    counter: totals[counter].get(user_id, 0)
+                    for counter in COUNTERS
+                },
+            )
+            for user_id in User.objects.filter(
+                pk__in=user_ids
+            ).values_list('pk', flat=True)
+        )
+    feed_cache.bump(*map(stats_feed, user_ids))
@@ -0,0 +1,183 @@
+"""Ленты постов в форматах RSS 2.0, Atom и JSON Feed.
+
+Ответ отдаётся потоком: посты читаются из базы итератором и
+сериализуются по одному, так что память не растёт вместе с лентой.
+Готовый текст кешируется под версией ленты постов (см. feed_cache) и
+перестаёт читаться, как только в ленте меняется пост.
+"""
+import hashlib
+import io
+import itertools
+import json
+import mimetypes
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.template.defaultfilters import linebreaksbr
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.feedgenerator import Atom1Feed, Enclosure, Rss201rev2Feed
+from django.utils.text import Truncator
+from django.utils.xmlutils import SimplerXMLGenerator
+
+from posts import feed_cache
+
+JSON_FEED_VERSION = 'https://jsonfeed.org/version/1.1'
+TITLE_LENGTH = 60
+FORMATS = {
+    'rss': Rss201rev2Feed.content_type,
+    'atom': Atom1Feed.content_type,
+    'json': 'application/feed+json; charset=utf-8',
+}
+
+
+def syndicate(request, fmt, feed, posts, title, link, description=''):
+    """Ответ с лентой posts в формате fmt.
+
+    feed -- лента постов из feed_cache: её версия служит ETag ответа
+    и ключом кеша, поэтому новый пост сбрасывает и то, и другое.
+    """
+    if fmt not in FORMATS:
+        raise Http404
+    version = feed_cache.get_version(*feed)
+    etag = quote_etag(hashlib.md5(f'{fmt}|{version}'.encode()).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+        return response
+    url = request.build_absolute_uri()
+    key = f'syndication:{hashlib.md5(url.encode()).hexdigest()}:{version}'
+    body = cache.get(key)
+    if body is not None:
+        response = HttpResponse(body, content_type=FORMATS[fmt])
+    else:
+        items = post_items(request, posts)
+        header = {
+            'title': title,
+            'link': request.build_absolute_uri(link),
+            'description': description,
+            'feed_url': url,
+        }
+        if fmt == 'json':
+            chunks = json_chunks(header, items)
+        else:
+            feed_class = Atom1Feed if fmt == 'atom' else Rss201rev2Feed
+            chunks = xml_chunks(
+                feed_class(language=settings.LANGUAGE_CODE, **header), items
+            )
+        response = StreamingHttpResponse(
+            cached(key, chunks), content_type=FORMATS[fmt]
+        )
+    response['ETag'] = etag
+    return response
+
+
+def cached(key, chunks):
+    """Отдаёт chunks дальше и кеширует текст, если ленту дочитали."""
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    cache.set(key, ''.join(parts), settings.FEED_CACHE_TIMEOUT)
+
+
+def post_items(request, posts):
+    """Последние посты в виде аргументов SyndicationFeed.add_item.
+
+    description -- HTML для RSS и Atom, content_text -- исходный текст
+    для JSON Feed.
+    """
+    posts = posts.select_related('author', 'group').order_by(
+        '-pub_date', '-pk')[:settings.SYNDICATION_ITEMS]
+    for post in posts.iterator():
+        link = request.build_absolute_uri(
+            reverse('posts:post_detail', args=[post.pk])
+        )
+        enclosures = []
+        if post.image and post.image_bytes:
+            enclosures.append(Enclosure(
+                request.build_absolute_uri(post.image.url),
+                str(post.image_bytes),
+                mimetypes.guess_type(post.image.name)[0] or '',
+            ))
+        yield {
+            'title': Truncator(post.text).chars(TITLE_LENGTH),
+            'link': link,
+            'description': linebreaksbr(post.text),
+            'content_text': post.text,
+            'unique_id': link,
+            'author_name': (
+                post.author.get_full_name() or post.author.username
+            ),
+            'pubdate': post.pub_date,
+            'categories': [post.group.title] if post.group else (),
+            'enclosures': enclosures,
+        }
+
+
+def drain(buffer):
+    value = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return value
+
+
+def xml_chunks(feed, items):
+    """RSS или Atom по частям: заголовок, затем по одному элементу."""
+    def normalize(item):
+        feed.add_item(**item)
+        return feed.items.pop()
+
+    items = map(normalize, items)
+    first = next(items, None)
+    # Дата ленты (lastBuildDate, updated) берётся из её первого поста.
+    feed.items = [first] if first else []
+    buffer = io.StringIO()
+    handler = SimplerXMLGenerator(buffer, 'utf-8')
+    handler.startDocument()
+    atom = isinstance(feed, Atom1Feed)
+    if atom:
+        handler.startElement('feed', feed.root_attributes())
+    else:
+        handler.startElement('rss', feed.rss_attributes())
+        handler.startElement('channel', feed.root_attributes())
+    feed.add_root_elements(handler)
+    for item in itertools.chain(feed.items, items):
+        yield drain(buffer)
+        feed.items = [item]
+        feed.write_items(handler)
+    if atom:
+        handler.endElement('feed')
+    else:
+        feed.endChannelElement(handler)
+        handler.endElement('rss')
+    yield drain(buffer)
+
+
+def json_chunks(header, items):
+    """JSON Feed по частям: заголовок, затем по одному элементу."""
+    head = json.dumps({
+        'version': JSON_FEED_VERSION,
+        'title': header['title'],
+        'home_page_url': header['link'],
+        'feed_url': header['feed_url'],
+        'description': header['description'],
+        'language': settings.LANGUAGE_CODE,
+    }, ensure_ascii=False)
+    yield head[:-1] + ',"items":['
+    for index, item in enumerate(items):
+        entry = {
+            'id': item['unique_id'],
+            'url': item['link'],
+            'title': item['title'],
+            'content_text': item['content_text'],
+            'date_published': item['pubdate'].isoformat(),
+            'authors': [{'name': item['author_name']}],
+        }
+        if item['categories']:
+            entry['tags'] = list(item['categories'])
+        if item['enclosures']:
+            entry['image'] = item['enclosures'][0].url
+        yield (',' if index else '') + json.dumps(entry, ensure_ascii=False)
+    yield ']}'
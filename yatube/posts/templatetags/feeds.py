@@ -0,0 +1,43 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from posts.feed_cache import fragment_vary_on
+
+register = template.Library()
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, feed):
+        self.nodelist = nodelist
+        self.feed = feed
+
+    def render(self, context):
+        feed = [part.resolve(context) for part in self.feed]
+        key = make_template_fragment_key(
+            'feed', fragment_vary_on(feed, context['request'])
+        )
+        value = cache.get(key)
+        if value is None:
+            value = self.nodelist.render(context)
+            cache.set(key, value, settings.FEED_CACHE_TIMEOUT)
+        return value
+
+
+@register.tag
+def feedcache(parser, token):
+    """Кеширует фрагмент ленты с учётом версии ленты и страницы.
+
+        {% feedcache 'group' group.pk %} ... {% endfeedcache %}
+    """
+    nodelist = parser.parse(('endfeedcache',))
+    parser.delete_first_token()
+    bits = token.split_contents()[1:]
+    if not bits:
+        raise template.TemplateSyntaxError(
+            "'feedcache' tag requires the feed name."
+        )
+    return FeedCacheNode(
+        nodelist, [parser.compile_filter(bit) for bit in bits]
+    )
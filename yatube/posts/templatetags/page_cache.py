@@ -0,0 +1,12 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts import page_cache
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, **args):
+    """Фрагмент для пользователя: {% hole 'follow_button' author=... %}."""
+    return mark_safe(page_cache.hole(context.get('request'), name, args))
@@ -0,0 +1,9 @@
+from django import template
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post, name):
+    """Адрес готовой миниатюры: {% post_thumbnail post 'card' as url %}."""
+    return post.thumbnail_url(name)
@@ -0,0 +1,129 @@
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+GROUP_SLUG = 'api_group'
+USERNAME = 'reader'
+USERNAME_AUTHOR = 'writer'
+POSTS_URL = reverse('api:posts')
+GROUPS_URL = reverse('api:groups')
+GROUP_URL = reverse('api:group_detail', kwargs={'slug': GROUP_SLUG})
+GROUP_POSTS_URL = reverse('api:group_posts', kwargs={'slug': GROUP_SLUG})
+PROFILE_URL = reverse('api:profile', kwargs={'username': USERNAME_AUTHOR})
+PROFILE_POSTS_URL = reverse(
+    'api:profile_posts', kwargs={'username': USERNAME_AUTHOR}
+)
+FOLLOW_URL = reverse('api:follow')
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username=USERNAME)
+        cls.author = User.objects.create_user(username=USERNAME_AUTHOR)
+        cls.group = Group.objects.create(
+            title='Группа API', slug=GROUP_SLUG, description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {i}'
+            )
+            for i in range(5)
+        ]
+        cls.comment = Comment.objects.create(
+            post=cls.posts[0], author=cls.user, text='Комментарий'
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.POST_URL = reverse(
+            'api:post_detail', kwargs={'post_id': cls.posts[0].pk}
+        )
+        cls.COMMENTS_URL = reverse(
+            'api:post_comments', kwargs={'post_id': cls.posts[0].pk}
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.reader = Client()
+        self.reader.force_login(self.user)
+
+    def test_endpoints(self):
+        """Каждый ресурс отдаётся в JSON."""
+        expected = (
+            (POSTS_URL, self.client, 'results'),
+            (self.POST_URL, self.client, 'text'),
+            (self.COMMENTS_URL, self.client, 'results'),
+            (GROUPS_URL, self.client, 'results'),
+            (GROUP_URL, self.client, 'slug'),
+            (GROUP_POSTS_URL, self.client, 'results'),
+            (PROFILE_URL, self.client, 'post_count'),
+            (PROFILE_POSTS_URL, self.client, 'results'),
+            (FOLLOW_URL, self.reader, 'results'),
+        )
+        for url, client, key in expected:
+            with self.subTest(url=url):
+                response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(key, response.json())
+        self.assertEqual(self.client.get(PROFILE_URL).json()['post_count'], 5)
+        self.assertEqual(
+            self.client.get(self.COMMENTS_URL).json()['results'][0]['text'],
+            self.comment.text,
+        )
+        self.assertEqual(self.client.get(FOLLOW_URL).status_code, 401)
+        self.assertEqual(self.client.post(POSTS_URL).status_code, 405)
+        self.assertEqual(
+            self.client.get(
+                reverse('api:group_detail', kwargs={'slug': 'none'})
+            ).json(),
+            {'detail': 'Не найдено.'},
+        )
+
+    def test_sparse_fieldsets(self):
+        """?fields= оставляет в ответе только запрошенные поля."""
+        for url in (POSTS_URL, FOLLOW_URL):
+            with self.subTest(url=url):
+                results = self.reader.get(
+                    url, {'fields': 'id,author'}).json()['results']
+                self.assertEqual(
+                    results[0],
+                    {'id': self.posts[-1].pk, 'author': USERNAME_AUTHOR},
+                )
+        response = self.client.get(self.POST_URL, {'fields': 'text'})
+        self.assertEqual(response.json(), {'text': self.posts[0].text})
+        response = self.client.get(POSTS_URL, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(API_PAGE_SIZE=2)
+    def test_cursor_pagination(self):
+        """Курсор проходит весь список без пропусков и повторов."""
+        for url in (POSTS_URL, GROUP_POSTS_URL, FOLLOW_URL):
+            with self.subTest(url=url):
+                ids = []
+                next_url = f'{url}?fields=id'
+                while next_url:
+                    data = self.reader.get(next_url).json()
+                    ids += [row['id'] for row in data['results']]
+                    next_url = data['next']
+                self.assertEqual(
+                    ids, [post.pk for post in reversed(self.posts)]
+                )
+        response = self.client.get(POSTS_URL, {'after': 'broken'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_etag(self):
+        """Неизменившийся ресурс отдаётся ответом 304."""
+        for url, client in (
+            (POSTS_URL, self.client),
+            (self.POST_URL, self.client),
+            (PROFILE_URL, self.client),
+            (FOLLOW_URL, self.reader),
+        ):
+            with self.subTest(url=url):
+                etag = client.get(url)['ETag']
+                response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                Post.objects.create(author=self.author, text=url)
+                response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
@@ -0,0 +1,73 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from posts import benchmark
+from posts.models import Comment
+
+
+def seed():
+    call_command(
+        'seed_yatube', '--users=10', '--groups=2', '--posts=20',
+        '--comments=5', '--follows=3',
+        stdout=StringIO(),
+    )
+
+
+class BenchmarkTests(TestCase):
+    def test_run_scenarios(self):
+        """Каждый сценарий отдаёт перцентили, запросы и размер ответа."""
+        seed()
+        results = benchmark.run(2)
+        self.assertEqual(list(results), [
+            *benchmark.SCENARIOS,
+            *(name + '/cold' for name in benchmark.SCENARIOS),
+        ])
+        for result in results.values():
+            self.assertLessEqual(result['p50'], result['p99'])
+            self.assertGreaterEqual(result['queries'], 0)
+        self.assertGreater(results['index']['bytes'], 0)
+        # Тёплую главную отдаёт кеш страниц, холодная идёт в базу.
+        self.assertEqual(results['index']['queries'], 0)
+        self.assertGreater(results['index/cold']['queries'], 0)
+
+    def test_too_few_requests(self):
+        """Перцентили не считаются по одному запросу."""
+        with self.assertRaises(CommandError):
+            call_command('benchmark_views', '--requests=1')
+
+    def test_regressions(self):
+        """Регрессия -- рост p95 сверх порога или лишний запрос."""
+        baseline = {
+            'index': {'p95': 10, 'queries': 3},
+            'profile': {'p95': 10, 'queries': 3},
+        }
+        results = {
+            'index': {'p95': 12, 'queries': 3},
+            'profile': {'p95': 13, 'queries': 4},
+            'post_detail': {'p95': 100, 'queries': 9},
+        }
+        self.assertEqual(
+            benchmark.regressions(results, baseline, 0.25),
+            [
+                'profile: p95 13 мс, было 10 мс',
+                'profile: 4 запросов, было 3',
+            ],
+        )
+
+
+class IndexAdvisorTests(TestCase):
+    def test_feed_queries_use_indexes(self):
+        """Ленты читаются по составным индексам, без сортировки."""
+        seed()
+        output = StringIO()
+        call_command('index_advisor', stdout=output)
+        report = output.getvalue()
+        self.assertIn('Все запросы идут по индексам', report)
+        self.assertIn(
+            'posts_post_author_id_fe5487bf (author_id) '
+            '-- покрыт post_author_pub_date_idx',
+            report,
+        )
+        self.assertEqual(Comment.objects.count(), 5)
@@ -0,0 +1,203 @@
+import csv
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from posts import exchange
+from posts.models import Comment, Follow, Group, Post, Timeline, User
+from posts.paginators import count_cache_key
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.old_post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Старый пост'
+        )
+        Post.objects.filter(pk=cls.old_post.pk).update(
+            pub_date=timezone.now() - datetime.timedelta(days=10)
+        )
+        cls.post = Post.objects.create(author=cls.author, text='Новый пост')
+        Comment.objects.create(post=cls.post, author=cls.user, text='Ответ')
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output)
+
+    def export(self, *args):
+        call_command(
+            'export_yatube', f'--output={self.output}', *args,
+            stdout=StringIO(),
+        )
+
+    def test_export_jsonl(self):
+        """Каждая модель выгружается в свой JSONL со ссылками по именам."""
+        self.export('--chunk-size=1')
+        with open(os.path.join(self.output, 'post.jsonl')) as stream:
+            posts = [json.loads(line) for line in stream]
+        self.assertEqual(
+            [(post['author'], post['group'], post['text'])
+             for post in posts],
+            [
+                ('writer', 'group', 'Старый пост'),
+                ('writer', None, 'Новый пост'),
+            ],
+        )
+        with open(os.path.join(self.output, 'follow.jsonl')) as stream:
+            self.assertEqual(
+                json.loads(stream.read()),
+                {'user': 'reader', 'author': 'writer'},
+            )
+        self.assertEqual(
+            sorted(os.listdir(self.output)),
+            ['comment.jsonl', 'follow.jsonl', 'group.jsonl', 'post.jsonl'],
+        )
+
+    def test_export_since_csv_gzip(self):
+        """--since выгружает только новые посты и комментарии."""
+        since = (timezone.now() - datetime.timedelta(days=1)).isoformat()
+        self.export(
+            '--format=csv', '--gzip', f'--since={since}',
+            '--models', 'post', 'comment',
+        )
+        with gzip.open(os.path.join(self.output, 'post.csv.gz'), 'rt',
+                       encoding='utf-8') as stream:
+            posts = list(csv.DictReader(stream))
+        self.assertEqual([post['text'] for post in posts], ['Новый пост'])
+        self.assertEqual(
+            sorted(os.listdir(self.output)),
+            ['comment.csv.gz', 'post.csv.gz'],
+        )
+
+    def test_failed_export_leaves_no_temporary_file(self):
+        """Упавшая выгрузка не оставляет ни файла, ни .tmp."""
+        def broken():
+            yield {'slug': 'group', 'title': 'Группа'}
+            raise RuntimeError('Обрыв')
+
+        path = os.path.join(self.output, 'group.jsonl')
+        with self.assertRaises(RuntimeError):
+            exchange.write(path, 'group', 'jsonl', broken())
+        self.assertEqual(os.listdir(self.output), [])
+
+    def test_import_round_trip(self):
+        """Выгрузка загружается обратно с датами, ссылками и счётчиками."""
+        self.export()
+        pub_date = Post.objects.get(pk=self.old_post.pk).pub_date
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        cache.set(count_cache_key('index'), (0, time.time() + 60))
+        files = sorted(
+            os.path.join(self.output, name)
+            for name in os.listdir(self.output)
+        )
+        call_command(
+            'import_yatube', *files, '--batch-size=1', stdout=StringIO()
+        )
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertIsNone(cache.get(count_cache_key('index')))
+        post = Post.objects.get(text=self.old_post.text)
+        self.assertEqual(post.pub_date, pub_date)
+        self.assertEqual(post.group.slug, self.group.slug)
+        self.assertEqual(post.group.title, self.group.title)
+        self.assertEqual(post.author.username, self.author.username)
+        self.assertEqual(Comment.objects.get().post.text, self.post.text)
+        self.assertTrue(Follow.objects.filter(
+            user__username='reader', author__username='writer'
+        ).exists())
+        author = User.objects.get(username='writer')
+        self.assertFalse(author.has_usable_password())
+        self.assertEqual(author.stats.post_count, 2)
+        self.assertEqual(author.stats.follower_count, 1)
+        call_command(
+            'import_yatube', os.path.join(self.output, 'follow.jsonl'),
+            stdout=StringIO(),
+        )
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_import_next_to_existing_posts(self):
+        """Загрузка в базу с постами выдаёт новые id и не трогает старые."""
+        self.export()
+        call_command(
+            'import_yatube',
+            *(os.path.join(self.output, name)
+              for name in ('group.jsonl', 'post.jsonl', 'comment.jsonl')),
+            stdout=StringIO(),
+        )
+        self.assertEqual(Post.objects.count(), 4)
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).comments.count(), 1
+        )
+        imported = Post.objects.filter(text=self.post.text).latest('pk')
+        self.assertGreater(imported.pk, self.post.pk)
+        self.assertEqual(imported.pub_date, self.post.pub_date)
+        self.assertEqual(imported.comments.get().text, 'Ответ')
+        self.assertEqual(Group.objects.count(), 1)
+
+    def test_failed_import_is_rolled_back(self):
+        """Ошибка в любом файле отменяет всю загрузку."""
+        self.export()
+        Post.objects.all().delete()
+        with open(os.path.join(self.output, 'comment.jsonl'), 'a') as stream:
+            stream.write('{не json\n')
+        with self.assertRaises(ValueError):
+            call_command(
+                'import_yatube',
+                os.path.join(self.output, 'post.jsonl'),
+                os.path.join(self.output, 'comment.jsonl'),
+                stdout=StringIO(),
+            )
+        self.assertFalse(Post.objects.exists())
+
+
+class SeedTests(TestCase):
+    def seed(self):
+        call_command(
+            'seed_yatube', '--users=30', '--groups=3', '--posts=60',
+            '--comments=20', '--follows=4', '--seed=7', '--batch-size=16',
+            stdout=StringIO(),
+        )
+        return list(Post.objects.order_by('pk').values_list(
+            'author__username', 'group__slug', 'text', 'pub_date'
+        ))
+
+    def test_seed_is_deterministic(self):
+        """Один seed -- одни и те же данные."""
+        posts = self.seed()
+        self.assertEqual(len(posts), 60)
+        self.assertEqual(Comment.objects.count(), 20)
+        self.assertTrue(Follow.objects.exists())
+        followed = User.objects.get(username='s7-user-0')
+        self.assertEqual(
+            followed.stats.follower_count,
+            Follow.objects.filter(author=followed).count(),
+        )
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.assertEqual(self.seed(), posts)
+
+    def test_seed_rerun_fails_before_writing(self):
+        """Повтор того же seed отказывает, ничего не записав."""
+        self.seed()
+        self.assertTrue(Timeline.objects.exists())
+        users = User.objects.count()
+        with self.assertRaises(CommandError):
+            self.seed()
+        self.assertEqual(User.objects.count(), users)
+        self.assertEqual(Post.objects.count(), 60)
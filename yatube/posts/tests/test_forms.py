@@ -1,15 +1,22 @@
 import shutil
 import tempfile
 from http import HTTPStatus
+from io import BytesIO
 
+from django.db import DatabaseError, connection, transaction
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
+from PIL import Image
 
+from core.models import MediaFile
+from core.storage import retain
+from posts.forms import PostForm
 from posts.models import Group, Post, User, Comment
 
 GROUP_SLUG = 'slug'
+CONTENT_NAME_WEBP = r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.webp$'
 USERNAME_AUTHOR = 'Author'
 USERNAME_USER = 'Auth_user'
 LOGIN_URL = reverse('users:login')
@@ -30,6 +37,13 @@ SMALL_GIF = (
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
+def run_on_commit():
+    """Выполняет отложенные on_commit: TestCase транзакцию не фиксирует."""
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostCreateFormTests(TestCase):
     @classmethod
@@ -118,10 +132,8 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(
             post.author, self.author
         )
-        self.assertEqual(
-            post.image.name,
-            f'{post.image.field.upload_to}{self.test_image.name}'
-        )
+        self.assertRegex(post.image.name, CONTENT_NAME_WEBP)
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
 
     def test_author_edit_post(self):
         """Редактирование поста."""
@@ -153,10 +165,95 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(
             post_edit.author, self.post.author
         )
-        self.assertEqual(
-            post_edit.image.name,
-            f'{self.post.image.field.upload_to}{self.test_image_edit.name}'
-        )
+        self.assertRegex(post_edit.image.name, CONTENT_NAME_WEBP)
+
+    @override_settings(IMAGE_MAX_SIZE=20)
+    def test_image_is_normalized_on_upload(self):
+        """Картинка поворачивается по EXIF, уменьшается и теряет EXIF."""
+        photo = Image.new('RGB', (40, 30))
+        exif = photo.getexif()
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        photo.save(buffer, 'JPEG', exif=exif)
+        form = PostForm(
+            data={'text': 'Фото с телефона'},
+            files={'image': SimpleUploadedFile(
+                'photo.jpg', buffer.getvalue(), 'image/jpeg')},
+        )
+        self.assertTrue(form.is_valid())
+        post = form.save(commit=False)
+        post.author = self.author
+        post.save()
+        self.assertEqual((post.image_width, post.image_height), (15, 20))
+        self.assertEqual(post.image_bytes, post.image.size)
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.format, 'WEBP')
+            self.assertEqual(stored.size, (15, 20))
+            self.assertNotIn(0x0112, stored.getexif())
+
+    def test_same_image_is_stored_once(self):
+        """Одинаковые картинки -- один файл, он живёт, пока нужен."""
+        posts = []
+        for name in ('first.gif', 'second.gif'):
+            self.authorized_client_author.post(POST_CREATE_URL, data={
+                'text': name,
+                'image': SimpleUploadedFile(name, SMALL_GIF, 'image/gif'),
+            })
+            posts.append(Post.objects.get(text=name))
+        first, second = posts
+        self.assertEqual(first.image.name, second.image.name)
+        media = MediaFile.objects.get(name=first.image.name)
+        self.assertEqual(media.refs, 2)
+        first.delete()
+        media.refresh_from_db()
+        self.assertEqual(media.refs, 1)
+        self.assertTrue(second.image.storage.exists(second.image.name))
+        second.delete()
+        run_on_commit()
+        self.assertFalse(MediaFile.objects.filter(pk=media.pk).exists())
+        self.assertFalse(second.image.storage.exists(second.image.name))
+
+    def test_image_survives_rollback_and_reupload(self):
+        """Файл не удаляется при откате и при повторной загрузке."""
+        self.authorized_client_author.post(POST_CREATE_URL, data={
+            'text': 'Картинка',
+            'image': SimpleUploadedFile('first.gif', SMALL_GIF, 'image/gif'),
+        })
+        run_on_commit()
+        post = Post.objects.get(text='Картинка')
+        files = post.image.storage
+        try:
+            with transaction.atomic():
+                Post.objects.get(pk=post.pk).delete()
+                raise DatabaseError
+        except DatabaseError:
+            pass
+        self.assertEqual(connection.run_on_commit, [])
+        self.assertEqual(MediaFile.objects.get(name=post.image.name).refs, 1)
+        Post.objects.get(pk=post.pk).delete()
+        # Пока задача ждала фиксации, ту же картинку загрузили снова.
+        files.save('again.gif', SimpleUploadedFile('again.gif', SMALL_GIF))
+        retain(post.image.name)
+        run_on_commit()
+        self.assertTrue(files.exists(post.image.name))
+        self.assertEqual(MediaFile.objects.get(name=post.image.name).refs, 1)
+
+    def test_new_image_resets_thumbnails(self):
+        """Новая картинка сбрасывает адреса старых миниатюр."""
+        Post.objects.filter(pk=self.post.pk).update(
+            thumbnails='{"card": "/media/cache/old.jpg"}'
+        )
+        self.authorized_client_author.post(self.POST_EDIT_URL, data={
+            'text': 'Текст с новой картинкой',
+            'image': SimpleUploadedFile(
+                name='thumbs.gif',
+                content=SMALL_GIF,
+                content_type='image/gif'
+            ),
+        })
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.thumbnails, '')
+        self.assertEqual(post.thumbnail_url('card'), post.image.url)
 
     def test_guest_client_not_create_post_and_redirect(self):
         """Проверяем, что анонимный пользователь не создает запись в Post
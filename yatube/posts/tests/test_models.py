@@ -1,6 +1,11 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
 
-from posts.models import Comment, Follow, Group, Post, User
+from posts import search
+from posts.models import Comment, Follow, Group, Post, User, UserStats
 
 
 class PostModelTest(TestCase):
@@ -30,6 +35,16 @@ class PostModelTest(TestCase):
                 self.assertEqual(
                     Post._meta.get_field(field).verbose_name, expected_value)
 
+    def test_search_triggers_survive_migrations(self):
+        """Миграции, перестроившие posts_post, оставляют триггеры FTS."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                "AND tbl_name = 'posts_post'"
+            )
+            triggers = {name for name, in cursor.fetchall()}
+        self.assertEqual(triggers, set(search.TRIGGERS))
+
     def test_models_have_help_text(self):
         """Проверка help_text"""
         field_help_texts = {
@@ -120,3 +135,44 @@ class FollowModelTest(TestCase):
                 self.assertEqual(
                     follow._meta.get_field(field).help_text, expected_value
                 )
+
+
+class UserStatsModelTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def assertStats(self, user, **expected):
+        stats = UserStats.objects.get(user=user)
+        for counter, value in expected.items():
+            with self.subTest(counter=counter):
+                self.assertEqual(getattr(stats, counter), value)
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются вместе с постами, комментариями и подписками."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Ком')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertStats(self.author, post_count=1, follower_count=1)
+        self.assertStats(self.reader, comment_count=1, following_count=1)
+        follow.delete()
+        post.delete()
+        self.assertStats(self.author, post_count=0, follower_count=0)
+        self.assertStats(self.reader, comment_count=0, following_count=0)
+
+    def test_repair_command(self):
+        """repair_user_stats пересчитывает счётчики по базе."""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Пост{i}') for i in range(3)
+        )
+        UserStats.objects.filter(user=self.reader).delete()
+        output = StringIO()
+        call_command('repair_user_stats', '--chunk-size=1', stdout=output)
+        self.assertIn(
+            f'Пересчитано пользователей: {User.objects.count()}',
+            output.getvalue(),
+        )
+        self.assertStats(self.author, post_count=3)
+        self.assertStats(self.reader, post_count=0)
@@ -1,5 +1,6 @@
 from http import HTTPStatus
 
+from django.core.cache import cache
 from django.test import Client, TestCase
 from django.urls import reverse
 
@@ -12,6 +13,7 @@ USERNAME_USER = 'Auth_user'
 LOGIN = reverse('users:login')
 FOLLOW_URL = reverse('posts:follow_index')
 INDEX_URL = reverse('posts:index')
+SEARCH_URL = reverse('posts:search')
 POST_CREATE_URL = reverse('posts:post_create')
 GROUP_LIST_URL = reverse('posts:group_list', kwargs={'slug': GROUP_SLUG})
 PROFILE_URL_ANOTHER = reverse(
@@ -68,12 +70,17 @@ class StaticURLTests(TestCase):
         cls.another.force_login(cls.user)
         cls.author.force_login(cls.user_author)
 
+    def setUp(self):
+        cache.clear()
+
     def test_http_statuses(self):
         http_status = (
             (INDEX_URL, HTTP_OK,
              self.guest),
             (GROUP_LIST_URL, HTTP_OK,
              self.guest),
+            (SEARCH_URL, HTTP_OK,
+             self.guest),
             (PROFILE_URL_AUTHOR, HTTP_OK,
              self.guest),
             (self.POST_DETAIL_URL, HTTP_OK,
@@ -118,6 +125,8 @@ class StaticURLTests(TestCase):
                 self.guest),
             (GROUP_LIST_URL, 'posts/group_list.html',
                 self.guest),
+            (SEARCH_URL, 'posts/search.html',
+                self.guest),
             (PROFILE_URL_AUTHOR, 'posts/profile.html',
                 self.guest),
             (self.POST_DETAIL_URL, 'posts/post_detail.html',
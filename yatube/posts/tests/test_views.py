@@ -1,13 +1,18 @@
+import json
 import shutil
 import tempfile
+from xml.etree import ElementTree
 
 from django.core.cache import cache
+from django.db import connection
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 
-from posts.models import Follow, Group, Post, User
+from core.query_budget import QueryCounter
+from posts import page_cache, timeline
+from posts.models import Comment, Follow, Group, Post, Timeline, User
 
 POSTS_IN_SECOND_PAGES = 1
 GROUP_SLUG = 'test_slug'
@@ -27,6 +32,8 @@ GROUP2_LIST_URL = reverse('posts:group_list',
 GROUP3_LIST_URL = reverse('posts:group_list',
                           kwargs={'slug': GROUP3_SLUG})
 FOLLOW_URL = reverse('posts:follow_index')
+SEARCH_URL = reverse('posts:search')
+FEED_FORMATS = ('rss', 'atom', 'json')
 PROFILE_FOLLOW_URL = reverse('posts:profile_follow',
                              kwargs={'username': USERNAME_AUTHOR})
 PROFILE_UNFOLLOW_URL = reverse('posts:profile_unfollow',
@@ -34,7 +41,6 @@ PROFILE_UNFOLLOW_URL = reverse('posts:profile_unfollow',
 INDEX_PAGE_PAGINATE = INDEX_URL + '?page=2'
 GROUP2_URL = f'{GROUP2_LIST_URL}?page=2'
 PROFILE_PAGINATE = f'{PROFILE_URL}?page=2'
-FOLLOW_URL_SEC = f'{FOLLOW_URL}?page=2'
 POSTS_SEC_PAGE = 5
 
 SMALL_GIF = (
@@ -103,6 +109,9 @@ class TaskPagesTests(TestCase):
         super().tearDownClass()
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
+    def setUp(self):
+        cache.clear()
+
     def test_page_show_correct_context(self):
         """Шаблоны сформированы с правильным контекстом."""
         correct_context = (
@@ -133,15 +142,128 @@ class TaskPagesTests(TestCase):
             text='Проверка кэша'
         )
         response = self.authorized.get(INDEX_URL).content
-        new_post.delete()
-        after_delete_post = self.authorized.get(
+        Post.objects.filter(pk=new_post.pk).update(text='Без сигнала')
+        after_update_post = self.authorized.get(
             INDEX_URL).content
-        self.assertEqual(response, after_delete_post)
+        self.assertEqual(response, after_update_post)
         cache.clear()
-        after_delete_cache = self.authorized.get(
+        after_clear_cache = self.authorized.get(
             INDEX_URL
         ).content
-        self.assertNotEqual(response, after_delete_cache)
+        self.assertNotEqual(response, after_clear_cache)
+
+    def test_cache_feed_versions(self):
+        """Кэш лент зависит от страницы и сбрасывается при изменениях."""
+        cache.clear()
+        post = Post.objects.get(pk=self.post.pk)
+        urls = (INDEX_URL, GROUP_LIST_URL, PROFILE_URL)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized.get(url).content
+                post.text = f'Новый текст для {url}'
+                post.save()
+                after_save = self.authorized.get(url).content
+                self.assertNotEqual(response, after_save)
+                self.assertIn(post.text.encode(), after_save)
+        Post.objects.bulk_create(
+            Post(text=f'Страница{i}', author=self.author)
+            for i in range(settings.MAX_RECORDS)
+        )
+        post.save()
+        first_page = self.authorized.get(INDEX_URL).content
+        second_page = self.authorized.get(INDEX_PAGE_PAGINATE).content
+        self.assertNotEqual(first_page, second_page)
+        self.assertIn(post.text.encode(), second_page)
+
+    def test_conditional_get(self):
+        """Неизменившаяся страница отдаётся ответом 304."""
+        cache.clear()
+        for url in (GROUP_LIST_URL, PROFILE_URL, self.POST_DETAIL_URL):
+            with self.subTest(url=url):
+                etag = self.authorized.get(url)['ETag']
+                response = self.authorized.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                Post.objects.create(
+                    author=self.author, group=self.group, text=url)
+                response = self.authorized.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+        etag = self.authorized.get(PROFILE_URL)['ETag']
+        self.authorized.get(PROFILE_FOLLOW_URL)
+        response = self.authorized.get(PROFILE_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Отписаться')
+
+    def test_anonymous_page_cache(self):
+        """Анонимам страница отдаётся из кеша до изменения её лент."""
+        cache.clear()
+        first = self.client.get(GROUP_LIST_URL)
+        self.assertTemplateUsed(first, 'posts/group_list.html')
+        cached = self.client.get(GROUP_LIST_URL)
+        self.assertTemplateNotUsed(cached, 'posts/group_list.html')
+        self.assertEqual(cached.content, first.content)
+        Post.objects.create(
+            author=self.user, group=self.group2, text='Другая группа')
+        self.assertTemplateNotUsed(
+            self.client.get(GROUP_LIST_URL), 'posts/group_list.html')
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Сброс')
+        self.assertTemplateUsed(
+            self.client.get(GROUP_LIST_URL), 'posts/group_list.html')
+        self.assertTemplateUsed(
+            self.client.get(self.POST_DETAIL_URL), 'posts/post_detail.html')
+        self.assertTemplateNotUsed(
+            self.client.get(self.POST_DETAIL_URL), 'posts/post_detail.html')
+
+    def test_page_cache_holes(self):
+        """Вошедшие получают общую страницу из кеша со своими фрагментами."""
+        guest = self.client.get(PROFILE_URL)
+        self.assertNotContains(guest, 'Подписаться')
+        self.assertNotContains(guest, 'Пользователь: ')
+        for client, username, button in (
+            (self.following_user, self.follow_user.username, 'Отписаться'),
+            (self.authorized, self.user.username, 'Подписаться'),
+            (self.author_user, self.author.username, None),
+        ):
+            with self.subTest(username=username):
+                response = client.get(PROFILE_URL)
+                self.assertTemplateNotUsed(response, 'posts/profile.html')
+                self.assertTemplateUsed(response, 'includes/header.html')
+                self.assertContains(
+                    response, f'<span style="color:red">{username}</span>')
+                self.assertNotContains(response, '<!--hole:')
+                for text in ('Отписаться', 'Подписаться'):
+                    if text == button:
+                        self.assertContains(response, text)
+                    else:
+                        self.assertNotContains(response, text)
+        response = self.author_user.get(self.POST_DETAIL_URL)
+        self.assertContains(response, 'Добавить комментарий')
+        self.assertContains(response, self.POST_EDIT_URL)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        response = self.authorized.get(self.POST_DETAIL_URL)
+        self.assertTemplateNotUsed(response, 'posts/post_detail.html')
+        self.assertNotContains(response, self.POST_EDIT_URL)
+
+    def test_page_cache_ignores_unknown_params(self):
+        """Посторонние параметры запроса идут мимо кеша страниц."""
+        cache.clear()
+        self.client.get(GROUP_LIST_URL, {'page': 1})
+        self.assertTemplateNotUsed(
+            self.client.get(GROUP_LIST_URL, {'page': 1}),
+            'posts/group_list.html')
+        for _ in range(2):
+            self.assertTemplateUsed(
+                self.client.get(GROUP_LIST_URL, {'page': 1, 'x': 1}),
+                'posts/group_list.html')
+
+    def test_forged_hole_is_not_rendered(self):
+        """Неподписанный фрагмент из тела страницы не выполняется."""
+        request = self.authorized.get(PROFILE_URL).wsgi_request
+        request.punch_holes = True
+        token = page_cache.hole(request, 'header', {})
+        self.assertIn(self.user.username.encode(),
+                      page_cache.fill(request, token.encode()))
+        forged = token.replace('<!--hole:', '<!--hole:x')
+        self.assertEqual(page_cache.fill(request, forged.encode()), b'')
 
     def test_post_is_not_in_incorrect_page(self):
         """Проверка, что запись не попала на страницу для
@@ -158,10 +280,6 @@ class TaskPagesTests(TestCase):
     def test_paginator(self):
         Post.objects.all().delete()
         COUNT = settings.MAX_RECORDS + POSTS_SEC_PAGE
-        Follow.objects.create(
-            author=self.author,
-            user=self.user,
-        )
         Post.objects.bulk_create(
             Post(
                 text=f'Тестовый текст{i}',
@@ -170,13 +288,16 @@ class TaskPagesTests(TestCase):
             )
             for i in range(COUNT)
         )
+        Follow.objects.create(
+            author=self.author,
+            user=self.user,
+        )
         urls = {
             INDEX_URL: settings.MAX_RECORDS,
             INDEX_PAGE_PAGINATE: POSTS_SEC_PAGE,
             GROUP2_LIST_URL: settings.MAX_RECORDS,
             GROUP2_URL: POSTS_SEC_PAGE,
             FOLLOW_URL: settings.MAX_RECORDS,
-            FOLLOW_URL_SEC: POSTS_SEC_PAGE,
             PROFILE_URL: settings.MAX_RECORDS,
             PROFILE_PAGINATE: POSTS_SEC_PAGE,
         }
@@ -187,6 +308,137 @@ class TaskPagesTests(TestCase):
             ):
                 self.assertEqual(
                     len(self.authorized.get(url).context['page_obj']), num,)
+        # Дальше первой страницы лента подписок листается по курсору.
+        first = self.authorized.get(FOLLOW_URL).context['page_obj']
+        self.assertEqual(first.number, 1)
+        self.assertTrue(first.has_next())
+        second = self.authorized.get(
+            f'{FOLLOW_URL}?after={first.next_cursor}').context['page_obj']
+        self.assertEqual(len(second), POSTS_SEC_PAGE)
+        self.assertEqual(
+            list(self.authorized.get(
+                f'{FOLLOW_URL}?page=2').context['page_obj']),
+            list(first),
+        )
+
+    def test_cursor_paginator(self):
+        """Листание по курсору совпадает с листанием по номерам."""
+        Post.objects.all().delete()
+        Post.objects.bulk_create(
+            Post(text=f'Курсор{i}', author=self.author)
+            for i in range(settings.MAX_RECORDS + POSTS_SEC_PAGE)
+        )
+        first_page = self.authorized.get(INDEX_URL).context['page_obj']
+        second_page = self.authorized.get(
+            INDEX_PAGE_PAGINATE).context['page_obj']
+        after_page = self.authorized.get(
+            f'{INDEX_URL}?after={first_page.next_cursor}'
+        ).context['page_obj']
+        self.assertEqual(list(after_page), list(second_page))
+        self.assertFalse(after_page.has_next())
+        self.assertTrue(after_page.has_previous())
+        before_page = self.authorized.get(
+            f'{INDEX_URL}?before={after_page.previous_cursor}'
+        ).context['page_obj']
+        self.assertEqual(list(before_page), list(first_page))
+        self.assertFalse(before_page.has_previous())
+        broken_page = self.authorized.get(
+            f'{INDEX_URL}?after=broken').context['page_obj']
+        self.assertEqual(list(broken_page), list(first_page))
+
+    def test_thumbnail_url_is_precomputed(self):
+        """Шаблон выводит готовую миниатюру, а до неё -- оригинал."""
+        response = self.authorized.get(self.POST_DETAIL_URL)
+        self.assertContains(response, self.post.image.url)
+        Post.objects.filter(pk=self.post.pk).update(
+            thumbnails=json.dumps({'card': '/media/cache/card.jpg'})
+        )
+        cache.clear()
+        response = self.authorized.get(self.POST_DETAIL_URL)
+        self.assertContains(response, '/media/cache/card.jpg')
+
+    def test_syndication_feeds(self):
+        """Ленты группы отдаются потоком, кешируются и знают про 304."""
+        for fmt in FEED_FORMATS:
+            with self.subTest(fmt=fmt):
+                url = reverse(
+                    'posts:group_feed',
+                    kwargs={'slug': GROUP_SLUG, 'fmt': fmt},
+                )
+                response = self.client.get(url)
+                self.assertTrue(response.streaming)
+                content = b''.join(response.streaming_content)
+                if fmt == 'json':
+                    items = json.loads(content)['items']
+                    self.assertIn(self.post.text,
+                                  [item['content_text'] for item in items])
+                else:
+                    ElementTree.fromstring(content)
+                    self.assertIn(self.post.text.encode(), content)
+                cached = self.client.get(url)
+                self.assertFalse(cached.streaming)
+                self.assertEqual(cached.content, content)
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=cached['ETag'])
+                self.assertEqual(response.status_code, 304)
+                post = Post.objects.create(
+                    author=self.author, group=self.group, text=f'Новый {fmt}')
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=cached['ETag'])
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(
+                    post.text.encode(), b''.join(response.streaming_content))
+        for url in (
+            reverse('posts:index_feed', kwargs={'fmt': 'html'}),
+            reverse('posts:profile_feed',
+                    kwargs={'username': 'nobody', 'fmt': 'rss'}),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_search_finds_ranked_posts(self):
+        """Поиск находит посты по словам и забывает удалённый текст."""
+        Post.objects.create(author=self.author, text='Кот')
+        best = Post.objects.create(author=self.author, text='Кот кот котик')
+        other = Post.objects.create(author=self.author, text='Пёс')
+        page_obj = self.client.get(
+            SEARCH_URL, {'q': 'КОТ'}).context['page_obj']
+        self.assertEqual(len(page_obj), 2)
+        self.assertEqual(page_obj[0], best)
+        other.text = 'Котлета'
+        other.save()
+        self.assertIn(
+            other,
+            self.client.get(SEARCH_URL, {'q': 'кот'}).context['page_obj'],
+        )
+        for query in ('пёс', '"', ''):
+            with self.subTest(query=query):
+                self.assertEqual(len(self.client.get(
+                    SEARCH_URL, {'q': query}).context['page_obj']), 0)
+
+    @override_settings(COMMENTS_PER_PAGE=2)
+    def test_comments_are_paginated(self):
+        """Комментарии выводятся порциями, остальные -- по курсору."""
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.user, text=f'Комм{i}')
+            for i in range(3)
+        )
+        comments = self.authorized.get(
+            self.POST_DETAIL_URL).context['comments']
+        self.assertEqual(len(comments), 2)
+        self.assertTrue(comments.has_next())
+        response = self.authorized.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'after': comments.next_cursor},
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comment_list.html')
+        rest = response.context['comments']
+        self.assertEqual(len(rest), 1)
+        self.assertFalse(rest.has_next())
+        self.assertEqual(
+            {comment.text for comment in [*comments, *rest]},
+            {'Комм0', 'Комм1', 'Комм2'},
+        )
 
     def test_follow_authorized_author(self):
         """Проверка, что авторизованный пользователь может подписаться."""
@@ -214,6 +466,146 @@ class TaskPagesTests(TestCase):
             ).exists()
         )
 
+    def test_paginator_count_is_cached(self):
+        """Число постов берётся из кеша и сбрасывается новым постом."""
+        cache.clear()
+        response = self.authorized.get(PROFILE_URL)
+        self.assertEqual(response.context['page_obj'].paginator.count, 1)
+        Post.objects.bulk_create(
+            Post(text=f'Без сигнала{i}', author=self.author)
+            for i in range(2)
+        )
+        response = self.authorized.get(PROFILE_URL, {'page': 1})
+        self.assertEqual(response.context['page_obj'].paginator.count, 1)
+        Post.objects.create(text='С сигналом', author=self.author)
+        response = self.authorized.get(PROFILE_URL)
+        self.assertEqual(response.context['page_obj'].paginator.count, 4)
+
+    @override_settings(MAX_RECORDS=1)
+    def test_paginator_page_window(self):
+        """Ссылок на страницы ограниченное число."""
+        cache.clear()
+        Post.objects.bulk_create(
+            Post(text=f'Окно{i}', author=self.author) for i in range(30)
+        )
+        page_obj = self.authorized.get(
+            f'{PROFILE_URL}?page=15').context['page_obj']
+        self.assertEqual(page_obj.paginator.num_pages, 31)
+        self.assertEqual(
+            page_obj.page_window,
+            [1, '…', 13, 14, 15, 16, 17, '…', 31],
+        )
+
+    def test_timeline_follows_subscriptions(self):
+        """Новый пост попадает в ленту подписчика, отписка его убирает."""
+        new_post = Post.objects.create(
+            author=self.author,
+            text='Пост для ленты',
+        )
+        self.assertTrue(
+            Timeline.objects.filter(
+                user=self.follow_user, post=new_post).exists()
+        )
+        self.assertFalse(
+            Timeline.objects.filter(user=self.user, post=new_post).exists()
+        )
+        response = self.following_user.get(FOLLOW_URL)
+        self.assertEqual(response.context['page_obj'][0], new_post)
+        self.following_user.get(PROFILE_UNFOLLOW_URL)
+        self.assertFalse(
+            Timeline.objects.filter(user=self.follow_user).exists()
+        )
+        self.following_user.get(PROFILE_FOLLOW_URL)
+        response = self.following_user.get(FOLLOW_URL)
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, self.post]
+        )
+
+    @override_settings(TIMELINE_PUSH_LIMIT=1)
+    def test_follow_feed_merges_pulled_authors(self):
+        """Посты популярного автора читаются при запросе ленты."""
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.follow_user, author=self.user)
+        cache.clear()
+        pulled_post = Post.objects.create(
+            author=self.author,
+            text='Пост популярного автора',
+        )
+        pushed_post = Post.objects.create(
+            author=self.user,
+            text='Пост из ленты',
+        )
+        self.assertFalse(Timeline.objects.filter(post=pulled_post))
+        self.assertTrue(Timeline.objects.filter(post=pushed_post))
+        response = self.following_user.get(FOLLOW_URL)
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [pushed_post, pulled_post, self.post],
+        )
+        cache.clear()
+
+    @override_settings(TIMELINE_PUSH_LIMIT=1)
+    def test_author_back_under_push_limit(self):
+        """Автор, снова ставший обычным, не теряет постов в лентах."""
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertIn(self.author.pk, timeline.pulled_authors())
+        pulled_post = Post.objects.create(
+            author=self.author,
+            text='Пост популярного автора',
+        )
+        self.assertFalse(Timeline.objects.filter(post=pulled_post))
+        Follow.objects.filter(user=self.user, author=self.author).delete()
+        self.assertNotIn(self.author.pk, timeline.pulled_authors())
+        self.assertTrue(Timeline.objects.filter(
+            user=self.follow_user, post=pulled_post).exists())
+        response = self.following_user.get(FOLLOW_URL)
+        self.assertEqual(
+            list(response.context['page_obj']), [pulled_post, self.post]
+        )
+        cache.clear()
+
+    @override_settings(TIMELINE_PUSH_LIMIT=1)
+    def test_jobs_ignore_stale_pulled_cache(self):
+        """Задачи лент решают по счётчику подписчиков, а не по кешу."""
+        cache.set(timeline.PULLED_AUTHORS_KEY, frozenset({self.author.pk}))
+        post = Post.objects.create(author=self.author, text='Мимо кеша')
+        self.assertTrue(Timeline.objects.filter(
+            user=self.follow_user, post=post).exists())
+        cache.clear()
+
+    def test_query_count_does_not_grow_with_data(self):
+        """Число запросов страниц не зависит от числа постов и комментариев."""
+        urls = (
+            INDEX_URL,
+            GROUP_LIST_URL,
+            PROFILE_URL,
+            self.POST_DETAIL_URL,
+            FOLLOW_URL,
+        )
+
+        def count_queries(url):
+            cache.clear()
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                self.following_user.get(url)
+            return counter.count
+
+        expected = {url: count_queries(url) for url in urls}
+        for i in range(settings.MAX_RECORDS):
+            Post.objects.create(
+                author=self.author,
+                group=self.group,
+                text=f'Пост{i}',
+            )
+            Comment.objects.create(
+                post=self.post,
+                author=User.objects.create_user(username=f'commentator{i}'),
+                text=f'Комментарий{i}',
+            )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(count_queries(url), expected[url])
+
     def test_group_list_has_correct_context(self):
         """Группа в контексте Групп-ленты без искажения атрибутов"""
         group = self.authorized.get(
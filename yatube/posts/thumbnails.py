@@ -0,0 +1,69 @@
+"""Миниатюры картинок постов, посчитанные заранее.
+
+Шаблоны не вызывают sorl при отрисовке: они читают готовые адреса из
+Post.thumbnails. Миниатюры всех геометрий из POST_THUMBNAILS считает
+фоновая задача, поставленная после сохранения поста с новой картинкой.
+"""
+import json
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from sorl.thumbnail import delete, get_thumbnail
+from sorl.thumbnail.images import ImageFile
+
+from core import jobs
+from core.models import MediaFile
+from posts import feed_cache
+from posts.models import Post
+
+logger = logging.getLogger(__name__)
+
+
+def schedule(post):
+    """Ставит расчёт миниатюр, когда пост и картинка уже сохранены."""
+    transaction.on_commit(lambda: jobs.enqueue(generate, post.pk))
+
+
+@jobs.task
+def generate(post_id):
+    """Считает все миниатюры поста и сохраняет их адреса.
+
+    Возвращает словарь имя -> адрес; геометрии, которые не удалось
+    посчитать, пропускаются, и шаблон покажет для них оригинал.
+    """
+    post = Post.objects.filter(pk=post_id).only(
+        'image', 'author_id', 'group_id').first()
+    if post is None or not post.image:
+        return {}
+    urls = {}
+    for name, (geometry, options) in settings.POST_THUMBNAILS.items():
+        try:
+            urls[name] = get_thumbnail(post.image, geometry, **options).url
+        except Exception:
+            logger.exception('Не удалось сделать миниатюру %s для поста %s',
+                             name, post_id)
+    # Пока миниатюры считались, картинку могли заменить: тогда адреса
+    # устарели, и их запишет следующая генерация.
+    updated = Post.objects.filter(pk=post_id, image=post.image.name).update(
+        thumbnails=json.dumps(urls)
+    )
+    if updated:
+        feed_cache.bump(*feed_cache.post_feeds(post))
+    return urls
+
+
+@jobs.task
+def delete_image(name):
+    """Удаляет картинку без ссылок вместе с её миниатюрами.
+
+    Строка MediaFile удаляется условно, в одной транзакции с файлом:
+    если картинку успели загрузить снова, ссылок уже не ноль, и файл
+    остаётся. Новая загрузка того же файла ждёт эту транзакцию
+    (ContentAddressedStorage.pin).
+    """
+    with transaction.atomic():
+        if MediaFile.objects.filter(name=name, refs=0).delete()[0]:
+            delete(ImageFile(
+                name, storage=Post._meta.get_field('image').storage
+            ))
@@ -0,0 +1,233 @@
+import time
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from core import jobs, metrics
+from posts.models import Follow, Post, Timeline, UserStats
+from posts.paginators import (
+    FEED_ORDERING, MergedCursorPaginator, invalidate_counts,
+)
+
+TIMELINE_ORDERING = ('-pub_date', '-post_id')
+PULLED_AUTHORS_KEY = 'timeline:pulled-authors'
+
+
+def pulled_authors():
+    """Авторы, чьи посты не раскладываются по лентам, а читаются сразу.
+
+    Это авторы, у которых подписчиков больше TIMELINE_PUSH_LIMIT.
+    Множество кешируется для чтения ленты; задачи записи решают по базе
+    (см. is_pulled).
+    """
+    authors = cache.get(PULLED_AUTHORS_KEY)
+    if authors is None:
+        authors = frozenset(
+            UserStats.objects.filter(
+                follower_count__gt=settings.TIMELINE_PUSH_LIMIT
+            ).values_list('user_id', flat=True)
+        )
+        cache.set(
+            PULLED_AUTHORS_KEY,
+            authors,
+            settings.TIMELINE_PULL_CACHE_TIMEOUT,
+        )
+    return authors
+
+
+def is_pulled(author_id):
+    """Читается ли автор напрямую, по его счётчику подписчиков.
+
+    Задачи решают по базе, а не по кешу pulled_authors(): кеш у
+    каждого процесса свой, и воркер с устаревшим множеством разложил
+    бы пост не туда.
+    """
+    return UserStats.objects.filter(
+        user_id=author_id,
+        follower_count__gt=settings.TIMELINE_PUSH_LIMIT,
+    ).exists()
+
+
+def fan_out(post):
+    """Раскладывает новый пост в ленты всех подписчиков автора.
+
+    Один INSERT ... SELECT по подпискам, сколько бы их ни было. Записи,
+    уже добавленные в ленту задачей backfill, пропускаются.
+    """
+    if is_pulled(post.author_id):
+        return
+    timeline_field = Timeline._meta.get_field
+    follow_field = Follow._meta.get_field
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{connection.ops.insert_statement(ignore_conflicts=True)} '
+            f'{quote(Timeline._meta.db_table)} '
+            f'({quote(timeline_field("user").column)}, '
+            f'{quote(timeline_field("post").column)}, '
+            f'{quote(timeline_field("pub_date").column)}) '
+            f'SELECT {quote(follow_field("user").column)}, %s, %s '
+            f'FROM {quote(Follow._meta.db_table)} '
+            f'WHERE {quote(follow_field("author").column)} = %s '
+            f'{connection.ops.ignore_conflicts_suffix_sql(True)}',
+            [
+                post.pk,
+                timeline_field('pub_date').get_db_prep_value(
+                    post.pub_date, connection
+                ),
+                post.author_id,
+            ],
+        )
+
+
+@jobs.task
+def deliver(post_id):
+    """Фоновая раскладка поста по лентам (см. fan_out)."""
+    post = Post.objects.filter(pk=post_id).only(
+        'author_id', 'pub_date').first()
+    if post is not None:
+        fan_out(post)
+
+
+@jobs.task
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика последние посты нового автора."""
+    if is_pulled(author_id):
+        return
+    # Задача могла дождаться очереди уже после отписки.
+    if not Follow.objects.filter(
+        user_id=user_id, author_id=author_id
+    ).exists():
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-pk'
+    ).values_list('pk', 'pub_date')[:settings.TIMELINE_BACKFILL]
+    Timeline.objects.bulk_create(
+        (Timeline(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    invalidate_counts(('follow', user_id))
+
+
+@jobs.task
+def push_author(author_id):
+    """Раскладывает последние посты автора по лентам всех подписчиков.
+
+    Нужна, когда автор опустился до TIMELINE_PUSH_LIMIT: пока его
+    читали напрямую, новые посты в таблицу лент не попадали.
+    """
+    if is_pulled(author_id):
+        return
+    posts = list(Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-pk'
+    ).values_list('pk', 'pub_date')[:settings.TIMELINE_BACKFILL])
+    followers = Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True)
+    batch = []
+    for user_id in followers.iterator():
+        batch.extend(
+            Timeline(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts
+        )
+        if len(batch) >= settings.TIMELINE_BATCH_SIZE:
+            Timeline.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Timeline.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def follower_count_changed(author_id, delta):
+    """Следит, не пересёк ли автор TIMELINE_PUSH_LIMIT после подписки.
+
+    На переходе кеш популярных авторов сбрасывается, чтобы запись и
+    чтение лент сразу решали одинаково, а вернувшемуся к раскладке
+    автору ленты подписчиков дозаполняются его постами.
+    """
+    count = UserStats.objects.filter(user_id=author_id).values_list(
+        'follower_count', flat=True).first()
+    if count is None:
+        return
+    limit = settings.TIMELINE_PUSH_LIMIT
+    if (count > limit) == (count - delta > limit):
+        return
+    cache.delete(PULLED_AUTHORS_KEY)
+    if count <= limit:
+        jobs.enqueue(push_author, author_id)
+
+
+def remove(user_id, author_id):
+    """Убирает из ленты подписчика посты автора после отписки."""
+    Timeline.objects.filter(
+        user_id=user_id,
+        post__author_id=author_id,
+    ).delete()
+    invalidate_counts(('follow', user_id))
+
+
+def rebuild(user_id):
+    """Пересобирает ленту читателя с нуля по его подпискам."""
+    Timeline.objects.filter(user_id=user_id).delete()
+    authors = Follow.objects.filter(
+        user_id=user_id
+    ).values_list('author_id', flat=True)
+    for author_id in authors:
+        backfill(user_id, author_id)
+
+
+def get_timeline(user):
+    """Лента подписок: записи с уже подтянутыми постами."""
+    return Timeline.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    )
+
+
+class FollowFeedPaginator(MergedCursorPaginator):
+    """Лента подписок: своя таблица плюс посты популярных авторов."""
+
+    def fetch(self, values, backwards, limit):
+        started = time.perf_counter()
+        rows = super().fetch(values, backwards, limit)
+        metrics.observe(
+            'follow_feed_merge_seconds', time.perf_counter() - started
+        )
+        metrics.observe(
+            'follow_feed_merge_streams',
+            len(self.streams),
+            buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+        )
+        return rows
+
+
+def feed_paginator(user, per_page):
+    """Пагинатор ленты подписок по гибридной схеме push/pull."""
+    metrics.set_gauge(
+        'follow_feed_push_limit', settings.TIMELINE_PUSH_LIMIT
+    )
+    pulled = pulled_authors()
+    if pulled:
+        pulled = list(
+            Follow.objects.filter(
+                user=user, author_id__in=pulled
+            ).values_list('author_id', flat=True)
+        )
+    streams = [(
+        get_timeline(user).exclude(post__author_id__in=pulled),
+        TIMELINE_ORDERING,
+        attrgetter('post'),
+    )]
+    if pulled:
+        # Все популярные авторы читаются одним потоком, чтобы число
+        # запросов ленты не росло вместе с числом таких подписок.
+        streams.append((
+            Post.objects.filter(author_id__in=pulled).select_related(
+                'author', 'group'
+            ),
+            FEED_ORDERING,
+            None,
+        ))
+    return FollowFeedPaginator(
+        streams, per_page, count_key=('follow', user.pk)
+    )
@@ -1,12 +1,17 @@
 from django.urls import path
 
 from posts.views import (
+    group_feed,
     group_posts,
+    index_feed,
     index,
     post_create,
+    post_comments,
     post_detail,
     post_edit,
     profile,
+    profile_feed,
+    search,
     add_comment,
     follow_index,
     profile_follow,
@@ -19,10 +24,23 @@ urlpatterns = [
     path('posts/<int:post_id>/edit/', post_edit, name='post_edit'),
     path('create/', post_create, name='post_create'),
     path('', index, name='index'),
+    path('feed/<str:fmt>/', index_feed, name='index_feed'),
     path('group/<slug:slug>/', group_posts, name='group_list'),
+    path('group/<slug:slug>/feed/<str:fmt>/', group_feed, name='group_feed'),
+    path('search/', search, name='search'),
     path('profile/<str:username>/', profile, name='profile'),
+    path(
+        'profile/<str:username>/feed/<str:fmt>/',
+        profile_feed,
+        name='profile_feed',
+    ),
     path('posts/<int:post_id>/', post_detail, name='post_detail'),
     path('posts/<int:post_id>/comment/', add_comment, name='add_comment'),
+    path(
+        'posts/<int:post_id>/comments/',
+        post_comments,
+        name='post_comments',
+    ),
     path('follow/', follow_index, name='follow_index'),
     path(
         'profile/<str:username>/follow/',
@@ -1,36 +1,98 @@
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.views.decorators.http import condition
 
+from core.query_budget import query_budget
+from posts import feed_cache
 from posts.forms import CommentForm, PostForm
+from posts.page_cache import surrogate
 from posts.models import Follow, Group, Post, User
+from posts.paginators import CursorPaginator, decode_cursor
+from posts.search import search_posts
+from posts.stats import get_stats, stats_feed
+from posts.syndication import syndicate
+from posts.timeline import feed_paginator
 
+COMMENTS_ORDERING = ('-created', '-pk')
 
-def get_page(posts, request):
-    paginator = Paginator(posts, settings.MAX_RECORDS)
-    page_number = request.GET.get("page")
-    return paginator.get_page(page_number)
+
+def get_page(posts, request, count_key=None):
+    paginator = posts
+    if not isinstance(paginator, Paginator):
+        paginator = CursorPaginator(
+            posts, settings.MAX_RECORDS, count_key=count_key
+        )
+    return paginator.get_page(
+        request.GET.get('page'),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+
+def get_comments_page(post, after=None):
+    """Порция комментариев поста по курсору, без COUNT и OFFSET."""
+    paginator = CursorPaginator(
+        post.comments.select_related('author'),
+        settings.COMMENTS_PER_PAGE,
+        COMMENTS_ORDERING,
+    )
+    page = paginator.cursor_page(decode_cursor(after))
+    if page is None:
+        page = paginator.cursor_page(None)
+    return page
+
+
+def group_etag(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    if group_id is not None:
+        return feed_cache.etag(request, ('group', group_id))
+
+
+def profile_etag(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    if author_id is not None:
+        return feed_cache.etag(
+            request, ('profile', author_id), stats_feed(author_id)
+        )
+
+
+def post_etag(request, post_id):
+    """Пост, комментарии и счётчик постов автора меняют ленту автора."""
+    author_id = Post.objects.filter(pk=post_id).values_list(
+        'author_id', flat=True).first()
+    if author_id is not None:
+        return feed_cache.etag(request, ('profile', author_id))
 
 
+@query_budget(4)
 def index(request):
-    posts = Post.objects.all()
-    page_obj = get_page(posts, request)
+    posts = Post.objects.select_related('author', 'group')
+    page_obj = get_page(posts, request, count_key=('index',))
+    surrogate(request, ('index',))
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@query_budget(6)
+@condition(etag_func=group_etag)
 def group_posts(request, slug):
     """Display all posts group."""
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('author')
+    surrogate(request, ('group', group.pk))
+    posts = group.posts.select_related('author', 'group')
     page_obj = get_page(
         posts,
         request,
+        count_key=('group', group.pk),
     )
     context = {
         'group': group,
@@ -39,33 +101,115 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@query_budget(1)
+def index_feed(request, fmt):
+    """Лента последних постов в RSS, Atom или JSON Feed."""
+    return syndicate(
+        request,
+        fmt,
+        ('index',),
+        Post.objects.all(),
+        'Последние обновления на сайте',
+        reverse('posts:index'),
+    )
+
+
+@query_budget(2)
+def group_feed(request, slug, fmt):
+    group = get_object_or_404(Group, slug=slug)
+    return syndicate(
+        request,
+        fmt,
+        ('group', group.pk),
+        group.posts.all(),
+        group.title,
+        reverse('posts:group_list', kwargs={'slug': slug}),
+        group.description,
+    )
+
+
+@query_budget(2)
+def profile_feed(request, username, fmt):
+    author = get_object_or_404(User, username=username)
+    return syndicate(
+        request,
+        fmt,
+        ('profile', author.pk),
+        author.posts.all(),
+        f'Посты пользователя {author.get_full_name() or author.username}',
+        reverse('posts:profile', kwargs={'username': username}),
+    )
+
+
+@query_budget(4)
+def search(request):
+    """Поиск по тексту постов, самые релевантные первыми."""
+    query = request.GET.get('q', '').strip()
+    paginator = Paginator(
+        search_posts(query).select_related('author', 'group'),
+        settings.MAX_RECORDS,
+    )
+    context = {
+        'query': query,
+        'page_obj': paginator.get_page(request.GET.get('page')),
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@query_budget(7)
+@condition(etag_func=profile_etag)
 def profile(request, username):
     current_author = get_object_or_404(User, username=username)
-    posts = current_author.posts.all()
-    following = (request.user.is_authenticated and request.user != username
-                 and Follow.objects.filter(
-                     user=request.user,
-                     author=current_author).exists())
-    page_obj = get_page(posts, request)
+    surrogate(
+        request, ('profile', current_author.pk), stats_feed(current_author.pk)
+    )
+    posts = current_author.posts.select_related('author', 'group')
+    page_obj = get_page(
+        posts, request, count_key=('profile', current_author.pk)
+    )
     context = {
         'author': current_author,
+        'author_stats': get_stats(current_author),
         'page_obj': page_obj,
-        'following': following
     }
     return render(request, 'posts/profile.html', context)
 
 
+@query_budget(6)
+@condition(etag_func=post_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    form = CommentForm(request.POST or None)
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id
+    )
+    surrogate(request, ('profile', post.author_id))
     return render(
         request,
         'posts/post_detail.html',
-        {'post': post, 'form': form}
+        {
+            'post': post,
+            'comments': get_comments_page(post),
+            'author_stats': get_stats(post.author),
+        }
+    )
+
+
+@query_budget(2)
+def post_comments(request, post_id):
+    """Следующая порция комментариев для кнопки «Показать ещё»."""
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    return render(
+        request,
+        'posts/includes/comment_list.html',
+        {
+            'post': post,
+            'comments': get_comments_page(post, request.GET.get('after')),
+        }
     )
 
 
 @login_required
+@transaction.atomic
+@query_budget(6)
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None,)
     if not form.is_valid():
@@ -77,9 +221,11 @@ def post_create(request):
 
 
 @login_required
+@transaction.atomic
+@query_budget(8)
 def post_edit(request, post_id):
     edit_post = get_object_or_404(Post, pk=post_id)
-    if request.user != edit_post.author:
+    if request.user.pk != edit_post.author_id:
         return redirect('posts:post_detail', post_id)
     form = PostForm(
         request.POST or None,
@@ -95,6 +241,8 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
+@query_budget(3)
 def add_comment(request, post_id):
     posts = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -107,9 +255,11 @@ def add_comment(request, post_id):
 
 
 @login_required
+@query_budget(6)
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_obj = get_page(post_list, request)
+    page_obj = get_page(
+        feed_paginator(request.user, settings.MAX_RECORDS), request
+    )
     context = {
         'page_obj': page_obj,
     }
@@ -117,6 +267,8 @@ def follow_index(request):
 
 
 @login_required
+@transaction.atomic
+@query_budget(10)
 def profile_follow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
@@ -127,6 +279,8 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
+@query_budget(6)
 def profile_unfollow(request, username):
     follower = request.user
     Follow.objects.filter(user=follower, author__username=username).delete()
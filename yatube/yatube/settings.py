@@ -36,6 +36,7 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 MIDDLEWARE = [
+    'core.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -44,6 +45,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'posts.page_cache.PageCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -71,6 +73,79 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
 MAX_RECORDS = 10
+COMMENTS_PER_PAGE = 20
+
+# Превышение бюджета запросов (core.query_budget) — ошибка, а не запись в лог.
+QUERY_BUDGET_STRICT = DEBUG
+# Таблицы, запросы к которым не входят в бюджет.
+QUERY_BUDGET_IGNORE_TABLES = ()
+
+# Кешированные COUNT(*) пагинатора: через PAGINATOR_COUNT_REFRESH секунд
+# значение пересчитывается в фоне, через PAGINATOR_COUNT_TIMEOUT удаляется.
+PAGINATOR_COUNT_REFRESH = 60
+PAGINATOR_COUNT_TIMEOUT = 60 * 60
+PAGINATOR_COUNT_ASYNC = True
+
+# Фрагменты лент хранятся долго: их сбрасывает версия ленты.
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+# Целые страницы: их тоже сбрасывают версии лент.
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+# Параметры запроса, с которыми страница ещё берётся из кеша.
+PAGE_CACHE_PARAMS = ('page', 'after', 'before')
+# Сколько последних постов попадает в RSS, Atom и JSON Feed.
+SYNDICATION_ITEMS = 50
+# Размер страницы списков JSON API.
+API_PAGE_SIZE = 20
+
+# Сколько последних постов автора попадает в ленту при подписке.
+TIMELINE_BACKFILL = 1000
+TIMELINE_BATCH_SIZE = 500
+# Посты авторов, у которых подписчиков больше этого числа, не раскладываются
+# по лентам, а подмешиваются при чтении ленты подписок.
+TIMELINE_PUSH_LIMIT = 10000
+TIMELINE_PULL_CACHE_TIMEOUT = 300
+
+# Миниатюры, которые шаблоны показывают для картинки поста:
+# имя -> (геометрия, параметры sorl). Считаются при загрузке картинки.
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+
+# Загруженные картинки поворачиваются по EXIF, теряют метаданные,
+# уменьшаются до IMAGE_MAX_SIZE по большей стороне и перекодируются.
+IMAGE_MAX_SIZE = 2048
+IMAGE_FORMAT = 'WEBP'
+IMAGE_QUALITY = 80
+
+# Заголовок Server-Timing с замерами SQL, шаблонов и кеша.
+SERVER_TIMING = DEBUG
+# /metrics отдаётся только с заголовком Authorization: Bearer <токен>;
+# None -- /metrics закрыт.
+METRICS_TOKEN = None
+# Каталог, через который процессы (веб-воркеры, runworker) складывают
+# метрики для /metrics; None -- /metrics видит только свой процесс.
+# Каталог очищают при перезапуске сайта.
+METRICS_DIR = None if DEBUG else os.path.join(BASE_DIR, 'run', 'metrics')
+METRICS_FLUSH_INTERVAL = 5
+
+# Запросы дольше SLOW_QUERY_THRESHOLD секунд пишутся в журнал
+# core.slow_queries с планом EXPLAIN; None -- журнал выключен.
+SLOW_QUERY_THRESHOLD = 0.1
+SLOW_QUERY_EXPLAIN = True
+# Полный просмотр этих таблиц отмечается в журнале.
+SLOW_QUERY_SCAN_TABLES = ('posts_post', 'posts_comment', 'posts_follow')
+
+# Базовая линия manage.py benchmark_views.
+BENCHMARK_BASELINE = os.path.join(BASE_DIR, 'benchmarks', 'baseline.json')
+
+# Очередь фоновых задач (core.jobs). В разработке задачи выполняются
+# сразу, без manage.py runworker.
+JOBS_EAGER = DEBUG
+JOBS_MAX_ATTEMPTS = 5
+# Пауза перед первым повтором, дальше она растёт вдвое.
+JOBS_RETRY_DELAY = 10
+# Сколько секунд задача числится за воркером, прежде чем её заберёт другой.
+JOBS_LEASE = 5 * 60
 
 
 DATABASES = {